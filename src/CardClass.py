@@ -1,68 +1,98 @@
 import random
-from typing import Optional
+from array import array
+from typing import Optional, Protocol
 import guiconstants as c
 
+SUITS = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
+RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
+IMAGE_RANKS = {'J': 'jack', 'Q': 'queen', 'K': 'king', 'A': 'ace'}
+
+# Cards are encoded as integers 0-51 (suit index * 13 + rank index) and everything
+# about a card is looked up from these tables instead of being worked out per instance
+CARD_SUIT = [suit for suit in SUITS for _ in RANKS]
+CARD_RANK = [rank for _ in SUITS for rank in RANKS]
+CARD_VALUE = [10 if rank in ('J', 'Q', 'K') else 11 if rank == 'A' else int(rank) for rank in CARD_RANK]
+CARD_IS_ACE = [rank == 'A' for rank in CARD_RANK]
+# the ten blackjack ranks: 2-9, ten-valued cards, aces (card value - 2)
+CARD_RANK_CLASS = [value - 2 for value in CARD_VALUE]
+CARD_NAME = [f"{rank} of {suit}" for suit, rank in zip(CARD_SUIT, CARD_RANK)]
+CARD_IMAGE_KEY = [f"{IMAGE_RANKS.get(rank, rank.lower())}_of_{suit.lower()}" for suit, rank in zip(CARD_SUIT, CARD_RANK)]
+
+
 class Card:
-    
-    SUITS = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
-    RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
-    
-    def __init__(self, suit: str, rank: str):
-        self.suit = suit
-        self.rank = rank
-        self.value = self._get_value()
-        self.is_ace = (rank == 'A')
-        self.face_up = True
-        
-    def _get_value(self) -> int:
-       # get the value of the card for blackjack
-        if self.rank in ['J', 'Q', 'K']:
-            return 10
-        elif self.rank == 'A':
-            return 11
-        else:
-            return int(self.rank)
-    
+    # Only 52 Card objects ever exist and every deck, shoe and hand shares them,
+    # so a card can't be changed once it is made. Whether a card is showing is
+    # up to the hand holding it (see Hand.face_down).
+
+    SUITS = SUITS
+    RANKS = RANKS
+
+    __slots__ = ('code', 'suit', 'rank', 'value', 'is_ace', 'rank_class')
+
+    _interned = {}
+
+    def __new__(cls, suit: str, rank: str):
+        return cls.from_code(SUITS.index(suit) * 13 + RANKS.index(rank))
+
+    @classmethod
+    def from_code(cls, code: int) -> 'Card':
+        # the shared instance for this code
+        card = cls._interned.get(code)
+        if card is None:
+            card = object.__new__(cls)
+            for name, value in (('code', code), ('suit', CARD_SUIT[code]), ('rank', CARD_RANK[code]),
+                                ('value', CARD_VALUE[code]), ('is_ace', CARD_IS_ACE[code]),
+                                ('rank_class', CARD_RANK_CLASS[code])):
+                object.__setattr__(card, name, value)
+            cls._interned[code] = card
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card objects are shared between decks and can't be changed")
+
+    def __reduce__(self):
+        # pickling (process pools, deepcopy) must come back to the interned instance
+        return (Card.from_code, (self.code,))
+
     def __str__(self) -> str:
         # string representation of the card
-        if not self.face_up:
-            return "Face Down Card"
-        return f"{self.rank} of {self.suit}"
+        return CARD_NAME[self.code]
     
-    # Method to get image key for card
-    def get_image_key(self) -> str:
-        if not self.face_up:
+    # Method to get image key for card (hands pass face_up for their hidden cards)
+    def get_image_key(self, face_up: bool = True) -> str:
+        if not face_up:
             return c.CARD_BACK_KEY
-        
-        rank_str = self.rank.lower()
-        if self.rank == 'J':
-            rank_str = 'jack'
-        elif self.rank == 'Q':
-            rank_str = 'queen'
-        elif self.rank == 'K':
-            rank_str = 'king'
-        elif self.rank == 'A':
-            rank_str = 'ace'
-        return f"{rank_str}_of_{self.suit.lower()}"
+        return CARD_IMAGE_KEY[self.code]
+
+
+# one face up copy of each card in code order, a shoe is just this repeated
+FULL_DECK = tuple(Card.from_code(code) for code in range(52))
+
+
+class RNG(Protocol):
+    # what a deck or shoe shuffles with: random.Random, or rng.NumpyRNG for NumPy streams
+    def shuffle(self, x) -> None: ...
+
+    def random(self) -> float: ...
 
 
 class Deck:
     
-    def __init__(self, num_decks: int = 1):
+    def __init__(self, num_decks: int = 1, rng: RNG | None = None):
         self.cards = []
+        # shuffles come from this generator so simulations can be seeded per table/worker
+        # (the module level random functions are used if none is given)
+        self.rng = rng if rng is not None else random
         self._create_deck(num_decks)
         self.shuffle()
         
     def _create_deck(self, num_decks: int) -> None:
-        # create a deck of cards with the specified number of decks
-        for _ in range(num_decks):
-            for suit in Card.SUITS:
-                for rank in Card.RANKS:
-                    self.cards.append(Card(suit, rank))
+        # create a deck of cards with the specified number of decks (all sharing the same Card objects)
+        self.cards = list(FULL_DECK) * num_decks
     
     def shuffle(self) -> None:
         # shuffle the deck randomly
-        random.shuffle(self.cards)
+        self.rng.shuffle(self.cards)
     
     def deal(self) -> Optional[Card]:
         # take the top card from the deck
@@ -75,54 +105,387 @@ class Deck:
         return len(self.cards)
 
 
+# labels for the rank classes a shoe keeps counts of
+RANK_CLASS_LABELS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'A']
+# Hi-Lo tags per rank class, the default system for Shoe.true_count
+HI_LO_TAGS = (1, 1, 1, 1, 1, 0, 0, 0, -1, -1)
+
+
+def rank_class_counts(codes) -> list[int]:
+    # how many cards of each rank class are in a run of card codes
+    counts = [0] * 10
+    for code in codes:
+        counts[CARD_RANK_CLASS[code]] += 1
+    return counts
+
+
+class Shoe:
+    # A casino shoe. The cards are card codes in a byte array dealt from a pointer,
+    # and the counts of each rank class still to come are kept up to date on every
+    # deal so composition, penetration and count queries never rescan the shoe.
+    # Once the cut card is out the dealt cards are shuffled back in place.
+
+    def __init__(self, num_decks: int = 6, penetration: float = 0.75, rng: RNG | None = None):
+        self.num_decks = num_decks
+        self.penetration = penetration
+        self.rng = rng if rng is not None else random
+        # a counting.CountTracker sees every card dealt when attached
+        self.counter = None
+        self.load(array('b', range(52)) * num_decks)
+        self.shuffle()
+
+    def load(self, codes) -> None:
+        # put these cards in the shoe, dealt in the order given
+        self._codes = array('b', codes)
+        self.size = len(self._codes)
+        # the cut card sits this many cards into the shoe
+        self.cut_card = int(self.size * self.penetration)
+        self.full_counts = rank_class_counts(self._codes)
+        self.counts = list(self.full_counts)
+        self.position = 0
+        self._recount()
+
+    def _recount(self) -> None:
+        # the counts jumped (shuffle, restore...), the tracker starts over from them
+        if self.counter is not None:
+            self.counter.sync()
+
+    def shuffle(self) -> None:
+        # shuffle every card back into the shoe
+        self.rng.shuffle(self._codes)
+        self.counts = list(self.full_counts)
+        self.position = 0
+        self._recount()
+
+    def deal(self) -> Optional[Card]:
+        # take the next card, None if the shoe is empty
+        position = self.position
+        if position >= self.size:
+            return None
+        code = self._codes[position]
+        self.position = position + 1
+        rank_class = CARD_RANK_CLASS[code]
+        self.counts[rank_class] -= 1
+        if self.counter is not None:
+            self.counter.add(rank_class)
+        return FULL_DECK[code]
+
+    def __len__(self) -> int:
+        # how many cards are left to deal
+        return self.size - self.position
+
+    def needs_reshuffle(self) -> bool:
+        # the cut card has come out
+        return self.position >= self.cut_card
+
+    def reshuffle(self, in_play: int = 0) -> None:
+        # shuffle the dealt cards back in, except the last in_play cards dealt which
+        # are still on the table; they stay at the front as already dealt
+        if not in_play:
+            self.shuffle()
+            return
+        position = self.position
+        on_table = self._codes[position - in_play:position]
+        rest = self._codes[:position - in_play] + self._codes[position:]
+        self.rng.shuffle(rest)
+        self._codes = on_table + rest
+        self.counts = [full - out for full, out in zip(self.full_counts, rank_class_counts(on_table))]
+        self.position = in_play
+        self._recount()
+
+    def snapshot(self) -> tuple:
+        # everything restore needs to put the shoe back where it is now (shuffle works in
+        # place, so the card order is copied: a few hundred bytes)
+        return self._codes[:], self.position, self.counts[:]
+
+    def restore(self, state: tuple) -> None:
+        codes, self.position, counts = state
+        self._codes = codes[:]
+        self.counts = counts[:]
+        self._recount()
+
+    def shuffle_remaining(self) -> None:
+        # reorder the cards not dealt yet, e.g. to play a rollout against unseen cards
+        position = self.position
+        rest = self._codes[position:]
+        self.rng.shuffle(rest)
+        self._codes[position:] = rest
+
+    def remaining(self, value: int) -> int:
+        # cards of this blackjack value (2-11, 10 covers J/Q/K) still to come
+        return self.counts[value - 2]
+
+    def remaining_composition(self) -> dict[str, int]:
+        # how many of each rank class are left to be dealt
+        return dict(zip(RANK_CLASS_LABELS, self.counts))
+
+    def dealt_fraction(self) -> float:
+        # how far into the shoe play has gone
+        return self.position / self.size if self.size else 1.0
+
+    def decks_remaining(self) -> float:
+        return (self.size - self.position) / 52
+
+    def running_count(self, tags=HI_LO_TAGS) -> int:
+        # the tags of every card dealt since the shuffle (Hi-Lo unless other tags are given)
+        return sum(tag * (full - left) for tag, full, left in zip(tags, self.full_counts, self.counts))
+
+    def true_count(self, tags=HI_LO_TAGS) -> float:
+        # running count over the decks left
+        decks = self.decks_remaining()
+        return self.running_count(tags) / decks if decks else 0.0
+
+
+# every card code of each rank class (the four suits, and J/Q/K too for tens)
+RANK_CLASS_CODES = [[code for code in range(52) if CARD_RANK_CLASS[code] == rank_class] for rank_class in range(10)]
+
+
+class CompositionShoe(Shoe):
+    # A shoe that stores how many of each rank class are left (and the rank class of
+    # each card dealt since the shuffle) and draws by weighted sampling on those counts,
+    # so it never builds or shuffles a card order. Dealing without replacement this way gives the same odds as a shuffled
+    # shoe. With infinite=True the counts never go down (infinite-deck approximation).
+
+    def __init__(self, num_decks: int = 8, penetration: float = 0.75, rng: RNG | None = None,
+                 infinite: bool = False):
+        self.num_decks = num_decks
+        self.penetration = penetration
+        self.rng = rng if rng is not None else random
+        self.infinite = infinite
+        self.counter = None
+        self.size = num_decks * 52
+        self.cut_card = int(self.size * penetration)
+        self.full_counts = [len(codes) * num_decks for codes in RANK_CLASS_CODES]
+        # rank class of every card dealt since the shuffle (at most a shoe's worth), so
+        # reshuffle knows which cards are still on the table however long the shoe ran
+        self._dealt = array('b')
+        self.shuffle()
+
+    def shuffle(self) -> None:
+        # every card back in the shoe
+        self.counts = list(self.full_counts)
+        self._left = self.size
+        self.position = 0
+        del self._dealt[:]
+        self._recount()
+
+    def deal(self) -> Optional[Card]:
+        # pick a rank class with probability proportional to what is left of it
+        if self._left <= 0:
+            return None
+        pick = int(self.rng.random() * self._left)
+        counts = self.counts
+        rank_class = 0
+        while pick >= counts[rank_class]:
+            pick -= counts[rank_class]
+            rank_class += 1
+        self.position += 1
+        if not self.infinite:
+            counts[rank_class] -= 1
+            self._left -= 1
+            self._dealt.append(rank_class)
+            if self.counter is not None:
+                self.counter.add(rank_class)
+        # which suit (or face) it is doesn't matter to the odds, reuse the leftover pick
+        codes = RANK_CLASS_CODES[rank_class]
+        return FULL_DECK[codes[pick % len(codes)]]
+
+    def __len__(self) -> int:
+        return self._left
+
+    def snapshot(self) -> tuple:
+        return self.counts[:], self._left, self.position, self._dealt[:]
+
+    def restore(self, state: tuple) -> None:
+        counts, self._left, self.position, dealt = state
+        self.counts = counts[:]
+        self._dealt = dealt[:]
+        self._recount()
+
+    def shuffle_remaining(self) -> None:
+        # every draw is already a fresh weighted pick
+        pass
+
+    def needs_reshuffle(self) -> bool:
+        return not self.infinite and self.position >= self.cut_card
+
+    def reshuffle(self, in_play: int = 0) -> None:
+        # the last in_play cards dealt are still on the table and stay out (an infinite
+        # shoe takes nothing out, so there is nothing to keep out either)
+        if self.infinite:
+            in_play = 0
+        if in_play > len(self._dealt):
+            raise ValueError(f"{in_play} cards on the table but only {len(self._dealt)} dealt since the shuffle")
+        on_table = self._dealt[len(self._dealt) - in_play:]
+        self.shuffle()
+        for rank_class in on_table:
+            self.counts[rank_class] -= 1
+        self._dealt = on_table
+        self._left -= len(on_table)
+        self.position = len(on_table)
+        self._recount()
+
+
+# Hand evaluation is one table lookup per card. A hand's state is its total, whether an
+# ace is still counted as 11 (soft), and how many cards it has (0, 1, 2 or 3+, enough to
+# spot a two-card blackjack). HAND_TRANSITIONS[state][rank_class] gives the next state
+# along with its (total, soft, bust, blackjack) so nothing is recalculated per card.
+HAND_MAX_TOTAL = 40
+HAND_TOTALS = HAND_MAX_TOTAL + 1
+
+
+def _hand_state(total: int, soft: bool, num_cards: int) -> int:
+    return (min(num_cards, 3) * 2 + soft) * HAND_TOTALS + min(total, HAND_MAX_TOTAL)
+
+
+def _build_hand_transitions() -> list[list[tuple]]:
+    transitions = []
+    for state in range(8 * HAND_TOTALS):
+        total = state % HAND_TOTALS
+        soft = (state // HAND_TOTALS) % 2
+        num_cards = state // (2 * HAND_TOTALS)
+        row = []
+        for rank_class in range(10):
+            value = rank_class + 2
+            # what add_card and _adjust_for_ace used to do
+            new_total = total + value
+            aces = soft + (value == 11)
+            while new_total > 21 and aces > 0:
+                new_total -= 10
+                aces -= 1
+            new_num_cards = num_cards + 1
+            row.append((_hand_state(new_total, aces > 0, new_num_cards), new_total, aces > 0,
+                        new_total > 21, new_num_cards == 2 and new_total == 21))
+        transitions.append(row)
+    return transitions
+
+
+HAND_TRANSITIONS = _build_hand_transitions()
+EMPTY_HAND_STATE = _hand_state(0, False, 0)
+
+
+def dealer_hit_table(hit_soft_17: bool = False) -> list[bool]:
+    # per hand state, whether the dealer draws: below 17, and on soft 17 too if the table hits it
+    table = []
+    for state in range(8 * HAND_TOTALS):
+        total = state % HAND_TOTALS
+        soft = (state // HAND_TOTALS) % 2
+        table.append(total < 17 or (hit_soft_17 and total == 17 and soft == 1))
+    return table
+
+
+DEALER_STANDS_ON_17 = dealer_hit_table()
+
+
 class Hand:
-    
+    # hands are reset in place between rounds (see clear and HandPool) rather than rebuilt
+
+    __slots__ = ('cards', 'state', 'value', 'soft', 'bust', 'blackjack', 'face_down')
+
     def __init__(self):
         self.cards = []
+        self.state = EMPTY_HAND_STATE
         self.value = 0
-        self.aces = 0
+        self.soft = False
+        self.bust = False
+        self.blackjack = False
+        # bit i is set while the card at position i is face down (the dealer's hole card)
+        self.face_down = 0
         
-    def add_card(self, card: Card) -> None:
-        # add a card to the hand and update the value
+    def add_card(self, card: Card, face_up: bool = True) -> None:
+        # add a card to the hand and look up the new value and flags
+        if not face_up:
+            self.face_down |= 1 << len(self.cards)
         self.cards.append(card)
-        self.value += card.value
-        
-        # keep track of aces since their value can change
-        if card.is_ace:
-            self.aces += 1
-            
-        # If we're over 21, try to use aces as 1 instead of 11
-        self._adjust_for_ace()
-            
-    def _adjust_for_ace(self) -> None:
-        # adjust the value of aces if we go over 21
-        while self.value > 21 and self.aces > 0:
-            self.value -= 10
-            self.aces -= 1
+        self.state, self.value, self.soft, self.bust, self.blackjack = HAND_TRANSITIONS[self.state][card.rank_class]
+
+    def snapshot(self) -> tuple:
+        # cards are shared and immutable, so a tuple of them is a full copy
+        return tuple(self.cards), self.state, self.value, self.soft, self.bust, self.blackjack, self.face_down
+
+    def restore(self, state: tuple) -> None:
+        cards, self.state, self.value, self.soft, self.bust, self.blackjack, self.face_down = state
+        self.cards[:] = cards
+
+    @property
+    def aces(self) -> int:
+        # aces still counted as 11 (never more than one)
+        return 1 if self.soft else 0
             
     def clear(self) -> None:
-        # reset the hand
-        self.cards = []
+        # reset the hand, keeping the same cards list
+        self.cards.clear()
+        self.state = EMPTY_HAND_STATE
         self.value = 0
-        self.aces = 0
+        self.soft = False
+        self.bust = False
+        self.blackjack = False
+        self.face_down = 0
+
+    def pop_card(self) -> Card:
+        # take the last card back out and recount what is left
+        card = self.cards.pop()
+        self.face_down &= ~(1 << len(self.cards))
+        state = EMPTY_HAND_STATE
+        self.value, self.soft, self.bust, self.blackjack = 0, False, False, False
+        for remaining_card in self.cards:
+            state, self.value, self.soft, self.bust, self.blackjack = HAND_TRANSITIONS[state][remaining_card.rank_class]
+        self.state = state
+        return card
+
+    def is_face_up(self, index: int) -> bool:
+        return not self.face_down & (1 << index)
+
+    def turn_face_up(self, index: int) -> None:
+        self.face_down &= ~(1 << index)
+
+    def get_image_key(self, index: int) -> str:
+        # image for the card at this position, the card back if it is face down
+        return self.cards[index].get_image_key(self.is_face_up(index))
         
     def __str__(self) -> str:
         #list the cards in the hand
-        return ", ".join(str(card) for card in self.cards)
+        return ", ".join(str(card) if self.is_face_up(i) else "Face Down Card" for i, card in enumerate(self.cards))
     
     def is_blackjack(self) -> bool:
-        # check if the hand is a blackjack (21 with 2 cards)
-        return len(self.cards) == 2 and self.value == 21
+        # check if the hand is a blackjack (21 with 2 cards), worked out when the card was added
+        return self.blackjack
+
+
+class HandPool:
+    # spare Hand objects for split hands, so a long session stops allocating new ones
+
+    __slots__ = ('_spare',)
+
+    def __init__(self):
+        self._spare = []
+
+    def acquire(self) -> Hand:
+        # an empty hand, reused if one has been handed back
+        return self._spare.pop() if self._spare else Hand()
+
+    def release(self, hand: Hand) -> None:
+        hand.clear()
+        self._spare.append(hand)
+
+    def __len__(self) -> int:
+        return len(self._spare)
 
 
 class Player:
-    
-    def __init__(self, name: str, chips: int = 1000):
+
+    __slots__ = ('name', 'chips', 'hands', 'current_hand_index', 'bets', 'hand_pool', 'surrendered')
+
+    def __init__(self, name: str, chips: int = 1000, hand_pool: Optional[HandPool] = None):
         self.name = name
         self.chips = chips
         self.hands = [Hand()]  # can have multiple hands when splitting
         self.current_hand_index = 0
         self.bets = [0]  # track bets for each hand
+        # split hands come from here and go back when the round is cleared
+        self.hand_pool = hand_pool if hand_pool is not None else HandPool()
+        # gave up the hand this round for half the bet back
+        self.surrendered = False
         
     def place_bet(self, amount: int, hand_index: int = 0) -> bool:
         #put the chips down, return True if successful
@@ -137,12 +500,36 @@ class Player:
         # add the winnings to the players stack
         self.chips += amount
         
+    def reset_hands(self) -> None:
+        # back to one empty hand, split hands go back to the pool (bets are left alone)
+        for hand in self.hands[1:]:
+            self.hand_pool.release(hand)
+        del self.hands[1:]
+        self.hands[0].clear()
+        self.current_hand_index = 0
+        self.surrendered = False
+
     def clear_hands(self) -> None:
         # start fresh with emmpty hands
-        self.hands = [Hand()]
-        self.current_hand_index = 0
-        self.bets = [0]
+        self.reset_hands()
+        del self.bets[1:]
+        self.bets[0] = 0
         
+    def snapshot(self) -> tuple:
+        return (self.chips, self.current_hand_index, tuple(self.bets), tuple(hand.snapshot() for hand in self.hands),
+                self.surrendered)
+
+    def restore(self, state: tuple) -> None:
+        self.chips, self.current_hand_index, bets, hands, self.surrendered = state
+        self.bets[:] = bets
+        # take split hands from (or give them back to) the pool to match the snapshot
+        while len(self.hands) > len(hands):
+            self.hand_pool.release(self.hands.pop())
+        while len(self.hands) < len(hands):
+            self.hands.append(self.hand_pool.acquire())
+        for hand, hand_state in zip(self.hands, hands):
+            hand.restore(hand_state)
+
     def split_hand(self) -> bool:
         # split the current hand into two hands if possible
         current_hand = self.hands[self.current_hand_index]
@@ -156,11 +543,9 @@ class Player:
             return False
         
         # create a new hand with one of the cards
-        new_hand = Hand()
-        new_hand.add_card(current_hand.cards.pop())
-        
-        # recalculate first hand's value after removing a card
-        current_hand._adjust_for_ace()
+        new_hand = self.hand_pool.acquire()
+        # (pop_card recalculates the first hand's value after removing a card)
+        new_hand.add_card(current_hand.pop_card())
         
         # set up the new hand with matching bet
         self.hands.append(new_hand)
@@ -177,10 +562,18 @@ class Player:
 
 class Dealer:
     # the dealer will play by the book exactly
-    
-    def __init__(self):
+
+    __slots__ = ('hand', 'hits')
+
+    def __init__(self, hits: list[bool] = DEALER_STANDS_ON_17):
         self.hand = Hand()
+        # whether to draw, by hand state (see dealer_hit_table)
+        self.hits = hits
         
+    def reveal_hole_card(self) -> None:
+        # turn the second card over at the start of the dealer's turn
+        self.hand.turn_face_up(1)
+
     def show_partial_hand(self) -> str:
         # show only the first card and hide the second one
         if len(self.hand.cards) > 0:
@@ -188,5 +581,5 @@ class Dealer:
         return "Dealer has no cards"
     
     def should_hit(self) -> bool:
-        # dealers play by the book - hit until they have 17 or more
-        return self.hand.value < 17
\ No newline at end of file
+        # dealers play by the book - hit until they have 17 or more (or on soft 17 under H17)
+        return self.hits[self.hand.state]
\ No newline at end of file
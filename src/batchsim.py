@@ -0,0 +1,290 @@
+import argparse
+import time
+import numpy as np
+from CardClass import Card, Hand, Shoe, CARD_VALUE
+from gamelogic import BlackjackGame
+from rng import NumpyRNG, make_rng
+from rules import RuleSet, compile_rules, parse_rules
+from settlement import Outcome, LOSSES, PUSHES, WINS
+from simulation import Simulator, SeatStats, STAND, POLICIES, format_report, never_surrender
+
+# Vectorized round simulator: thousands of independent tables play in lockstep as NumPy arrays.
+# Reproduces the object engine's dealing order, cut card, dealer play (S17 or H17), peek
+# and end_round payouts (settle_arrays) for a RuleSet. Players only hit or stand here (no
+# doubles, splits or surrender), so the rules for those never come into play.
+
+# card values in Card.SUITS x Card.RANKS order, aces count 11 like Card.value
+DECK_VALUES = np.array(CARD_VALUE, dtype=np.int8)
+
+# hit tables are indexed [soft, total, dealer upcard]; totals past 21 never hit
+MAX_TOTAL = 32
+
+
+def threshold_table(stand_on: int = 17) -> np.ndarray:
+    # hit below stand_on, soft or hard, whatever the dealer shows
+    table = np.zeros((2, MAX_TOTAL, 12), dtype=bool)
+    table[:, :stand_on, :] = True
+    return table
+
+
+def table_from_policy(policy) -> np.ndarray:
+    # evaluate a simulation policy's hit/stand choice for every hard and soft total
+    table = np.zeros((2, MAX_TOTAL, 12), dtype=bool)
+    hands = {}
+    for total in range(4, 22):
+        hard = [Card('Spades', '2'), Card('Spades', str(total - 2))] if total <= 12 else \
+               [Card('Spades', '10'), Card('Spades', str(total - 10))] if total < 21 else \
+               [Card('Spades', '10'), Card('Spades', '9'), Card('Spades', '2')]
+        hands[0, total] = hard
+    for total in range(12, 22):
+        hands[1, total] = [Card('Spades', 'A'), Card('Spades', 'A' if total == 12 else str(total - 11))]
+    for (soft, total), cards in hands.items():
+        hand = _hand_of(cards)
+        for upcard in range(2, 12):
+            table[soft, total, upcard] = policy(hand, upcard, False, False) != STAND
+    return table
+
+
+def _hand_of(cards: list[Card]) -> Hand:
+    hand = Hand()
+    for card in cards:
+        hand.add_card(card)
+    return hand
+
+
+def generate_shoes(rng: NumpyRNG, num_tables: int, num_shoes: int, num_decks: int = 6) -> np.ndarray:
+    # independently shuffled shoes, shape (tables, shoes, cards) in deal order
+    shoe = np.tile(DECK_VALUES, num_decks)
+    shoes = shoe[rng.permutations(shoe.size, num_tables * num_shoes)]
+    return shoes.reshape(num_tables, num_shoes, shoe.size)
+
+
+class BatchResult:
+    # per-table, per-seat totals with the same fields as simulation.SeatStats
+
+    def __init__(self, num_tables: int, num_players: int):
+        for field in SeatStats.FIELDS:
+            setattr(self, field, np.zeros((num_tables, num_players), dtype=np.int64))
+        self.rounds = np.zeros(num_tables, dtype=np.int64)
+
+    def seat_stats(self, table: int) -> list[SeatStats]:
+        # one table's seats as SeatStats, for comparing with the object engine
+        seats = []
+        for seat in range(self.net.shape[1]):
+            stats = SeatStats()
+            for field in SeatStats.FIELDS:
+                setattr(stats, field, int(getattr(self, field)[table, seat]))
+            seats.append(stats)
+        return seats
+
+    def seat_totals(self) -> list[SeatStats]:
+        # every table added together, seat by seat
+        seats = []
+        for seat in range(self.net.shape[1]):
+            stats = SeatStats()
+            for field in SeatStats.FIELDS:
+                setattr(stats, field, int(getattr(self, field)[:, seat].sum()))
+            seats.append(stats)
+        return seats
+
+
+def _add_card(total: np.ndarray, soft: np.ndarray, card: np.ndarray, mask: np.ndarray) -> None:
+    # Hand.add_card for every masked table at once, soft means an ace is still counted as 11
+    card = np.where(mask, card, 0)
+    aces = soft.astype(np.int8) + (card == 11)
+    total += card
+    # two aces counted as 11 is the most a hand can hold, so two passes of _adjust_for_ace do it
+    for _ in range(2):
+        over = (total > 21) & (aces > 0)
+        total -= over * 10
+        aces -= over
+    soft[:] = aces > 0
+
+
+def settle_arrays(totals: np.ndarray, blackjack: np.ndarray, bets, dealer_total: np.ndarray,
+                  dealer_blackjack: np.ndarray, rules: RuleSet | None = None) -> tuple[np.ndarray, np.ndarray]:
+    # settlement.settle_hand and payout for whole arrays of hands, shape (..., tables) against
+    # one dealer per table; returns the outcome codes and the chips paid back
+    dealer_bust = dealer_total > 21
+    outcomes = np.select(
+        [blackjack & dealer_blackjack, blackjack, totals > 21, dealer_blackjack, dealer_bust,
+         totals > dealer_total, totals < dealer_total],
+        [Outcome.BLACKJACK_PUSH, Outcome.BLACKJACK, Outcome.BUST, Outcome.DEALER_BLACKJACK,
+         Outcome.WIN_DEALER_BUST, Outcome.WIN, Outcome.LOSS],
+        Outcome.PUSH).astype(np.int8)
+    tables = compile_rules(rules if rules is not None else RuleSet())
+    payouts = np.asarray(bets) * np.array(tables.payouts, dtype=np.int64)[outcomes] // tables.payout_unit
+    return outcomes, payouts
+
+
+def play_shoes(shoes: np.ndarray, num_players: int = 1, hit_table: np.ndarray | None = None,
+               bet: int = 10, penetration: float = 0.75, rules: RuleSet | None = None) -> BatchResult:
+    # play every table through its shoes in order, reshuffling where BlackjackGame would.
+    # Each reshuffle moves on to the table's next shoe.
+    if hit_table is None:
+        hit_table = threshold_table(17)
+    rules = rules if rules is not None else RuleSet()
+    num_tables, num_shoes, shoe_size = shoes.shape
+    # one stream per table plus a blank column so reads past the last shoe stay in bounds
+    stream = np.zeros((num_tables, num_shoes * shoe_size + 1), dtype=np.int8)
+    stream[:, :-1] = shoes.reshape(num_tables, -1)
+    stream_end = num_shoes * shoe_size
+    rows = np.arange(num_tables)
+    ptr = np.zeros(num_tables, dtype=np.int64)
+    active = np.ones(num_tables, dtype=bool)
+    threshold = (num_players + 1) * 5
+    cut_card = int(shoe_size * penetration)
+    result = BatchResult(num_tables, num_players)
+
+    def draw(mask):
+        card = stream[rows, np.minimum(ptr, stream_end)]
+        ptr[:] += mask
+        return card
+
+    while active.any():
+        # reshuffle check from _deal_initial_cards_and_setup_play: cut card out or running low
+        dealt = ptr % shoe_size
+        reshuffle = active & ((dealt >= cut_card) | (shoe_size - dealt < threshold))
+        ptr[reshuffle] = (ptr[reshuffle] // shoe_size + 1) * shoe_size
+        active &= ptr < stream_end
+        if not active.any():
+            break
+
+        totals = np.zeros((num_players, num_tables), dtype=np.int16)
+        softs = np.zeros((num_players, num_tables), dtype=bool)
+        dealer_total = np.zeros(num_tables, dtype=np.int16)
+        dealer_soft = np.zeros(num_tables, dtype=bool)
+
+        # same order as the object engine: players, dealer up, players, dealer hole
+        for seat in range(num_players):
+            _add_card(totals[seat], softs[seat], draw(active), active)
+        upcard = draw(active)
+        _add_card(dealer_total, dealer_soft, upcard, active)
+        for seat in range(num_players):
+            _add_card(totals[seat], softs[seat], draw(active), active)
+        _add_card(dealer_total, dealer_soft, draw(active), active)
+
+        blackjack = totals == 21
+        dealer_blackjack = dealer_total == 21
+
+        # players act in seat order, blackjacks are skipped; a dealer who peeks ends the
+        # round on a blackjack before anyone plays
+        upcard_index = upcard.astype(np.intp)
+        playing = active & ~dealer_blackjack if rules.dealer_peeks else active
+        for seat in range(num_players):
+            total = totals[seat]
+            soft = softs[seat]
+            hitting = playing & ~blackjack[seat] & hit_table[soft.astype(np.intp), np.minimum(total, MAX_TOTAL - 1), upcard_index]
+            while hitting.any():
+                _add_card(total, soft, draw(hitting), hitting)
+                hitting &= (ptr <= stream_end) & (total <= 21) & hit_table[soft.astype(np.intp), np.minimum(total, MAX_TOTAL - 1), upcard_index]
+
+        # the dealer only plays if some hand is neither busted nor a blackjack
+        live = ((totals <= 21) & ~blackjack).any(axis=0)
+        if rules.dealer_peeks:
+            live &= ~dealer_blackjack
+        dealer_hits = lambda: (dealer_total < 17) | (rules.hit_soft_17 & (dealer_total == 17) & dealer_soft)
+        dealing = active & live & dealer_hits()
+        while dealing.any():
+            _add_card(dealer_total, dealer_soft, draw(dealing), dealing)
+            dealing &= (ptr <= stream_end) & dealer_hits()
+
+        # a round that ran past the last shoe is voided and the table stops
+        finished = active & (ptr <= stream_end)
+        active &= finished
+
+        outcomes, payouts = settle_arrays(totals, blackjack, bet, dealer_total, dealer_blackjack, rules)
+        mask = finished[np.newaxis, :]
+        result.net += ((payouts - bet) * mask).T
+        result.hands += mask.T
+        result.wagered += (bet * mask).T
+        result.wins += (np.isin(outcomes, list(WINS)) & mask).T
+        result.losses += (np.isin(outcomes, list(LOSSES)) & mask).T
+        result.pushes += (np.isin(outcomes, list(PUSHES)) & mask).T
+        result.blackjacks += ((outcomes == Outcome.BLACKJACK) & mask).T
+        result.busts += ((outcomes == Outcome.BUST) & mask).T
+        result.rounds += finished
+
+    return result
+
+
+class _ScriptedGame(BlackjackGame):
+    # headless game that takes its shoes from a list instead of shuffling new ones
+
+    class ShoesExhausted(Exception):
+        pass
+
+    def __init__(self, shoes: np.ndarray, num_players: int, penetration: float, rules: RuleSet | None = None):
+        self._shoes = iter(shoes)
+        super().__init__(num_players=num_players, num_decks=shoes.shape[1] // 52, headless=True,
+                         penetration=penetration, rules=rules)
+        self._reshuffle()
+
+    def _reshuffle(self) -> None:
+        values = next(self._shoes, None)
+        if values is None:
+            raise self.ShoesExhausted()
+        shoe = Shoe(self.num_decks, self.penetration)
+        shoe.load(_CODE_FOR_VALUE[value] for value in values.tolist())
+        self.deck = shoe
+
+
+_CODE_FOR_VALUE = {value: Card('Spades', rank).code for value, rank in
+                   zip(range(2, 12), ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'A'])}
+
+
+def cross_check(shoes: np.ndarray, num_players: int = 1, policy=None, bet: int = 10,
+                penetration: float = 0.75, rules: RuleSet | None = None) -> list[int]:
+    # replay the same shoes through BlackjackGame and return the tables whose totals differ
+    policy = policy or POLICIES['dealer']
+    hit_stand = lambda hand, upcard, can_double, can_split: policy(hand, upcard, False, False)
+    batch = play_shoes(shoes, num_players, table_from_policy(policy), bet, penetration, rules)
+
+    mismatched = []
+    for table in range(shoes.shape[0]):
+        simulator = Simulator(bet=bet, policy=hit_stand, surrender_policy=never_surrender,
+                              game=_ScriptedGame(shoes[table], num_players, penetration, rules))
+        try:
+            while True:
+                simulator.play_round()
+        except _ScriptedGame.ShoesExhausted:
+            pass
+        expected = [seat.as_dict() for seat in simulator.seats]
+        actual = [seat.as_dict() for seat in batch.seat_stats(table)]
+        if expected != actual or simulator.rounds != batch.rounds[table]:
+            mismatched.append(table)
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized blackjack simulation")
+    parser.add_argument('--tables', type=int, default=10000)
+    parser.add_argument('--shoes', type=int, default=10)
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--penetration', type=float, default=0.75)
+    parser.add_argument('--bet', type=int, default=10)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='basic', help="played hit/stand only")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--rules', type=parse_rules, default=RuleSet(), help="e.g. h17,6:5,peek")
+    parser.add_argument('--cross-check', type=int, default=0, metavar='TABLES',
+                        help="also replay this many tables through BlackjackGame and compare")
+    args = parser.parse_args()
+
+    rng = make_rng(args.seed, kind='pcg64')
+    policy = POLICIES[args.policy]
+    shoes = generate_shoes(rng, args.tables, args.shoes, args.decks)
+    start = time.perf_counter()
+    result = play_shoes(shoes, args.players, table_from_policy(policy), args.bet, args.penetration, args.rules)
+    elapsed = time.perf_counter() - start
+    print(f"{args.policy} policy played hit/stand only (no doubles, splits or surrender), {args.rules.describe()}")
+    print(format_report(result.seat_totals(), int(result.rounds.sum()), elapsed))
+
+    if args.cross_check:
+        mismatched = cross_check(shoes[:args.cross_check], args.players, policy, args.bet, args.penetration,
+                                 args.rules)
+        print(f"Cross-check against BlackjackGame: {args.cross_check - len(mismatched)}/{args.cross_check} tables identical")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import math
+import random
+import time
+from array import array
+from typing import NamedTuple
+from CardClass import HI_LO_TAGS, Shoe, CompositionShoe
+from simulation import Simulator, POLICIES, SHOE_TYPES
+
+# Card counting kept up to date as the shoe deals. Every system's running count lives in
+# its own 32-bit lane of one Python int, and each rank class has all its systems' tags
+# packed the same way, so a card costs a single addition however many systems are
+# tracked. When the shoe's counts jump (shuffle, reshuffle, restore) the counts are worked
+# out again from the tag vectors and the shoe's rank counts.
+
+
+class TagSystem(NamedTuple):
+    name: str
+    # tag per rank class: 2-9, tens, aces
+    tags: tuple[int, ...]
+
+    @property
+    def deck_sum(self) -> int:
+        # the tags of one full deck: 0 for a balanced count
+        return 4 * sum(self.tags) + 12 * self.tags[8]
+
+    def initial_count(self, num_decks: int) -> int:
+        # unbalanced counts (KO) start low enough to end the shoe at 0 after the last deck
+        return -self.deck_sum * (num_decks - 1)
+
+
+SYSTEMS = {system.name: system for system in (
+    TagSystem('hi-lo', HI_LO_TAGS),
+    TagSystem('ko', (1, 1, 1, 1, 1, 1, 0, 0, -1, -1)),
+    TagSystem('omega-ii', (1, 1, 2, 2, 2, 1, 0, -1, -2, 0)),
+    TagSystem('zen', (1, 1, 2, 2, 2, 1, 0, 0, -2, -1)),
+)}
+
+LANE_BITS = 32
+LANE_MASK = (1 << LANE_BITS) - 1
+# added to every lane while unpacking so negative counts come out right
+LANE_BIAS = 1 << (LANE_BITS - 1)
+
+
+class CountTracker:
+
+    def __init__(self, systems=tuple(SYSTEMS), keep_history: bool = False):
+        self.systems = [SYSTEMS[name] for name in systems]
+        self._lanes = {system.name: i for i, system in enumerate(self.systems)}
+        self._deltas = [sum(system.tags[rank_class] << (LANE_BITS * i) for i, system in enumerate(self.systems))
+                        for rank_class in range(10)]
+        self._bias = sum(LANE_BIAS << (LANE_BITS * i) for i in range(len(self.systems)))
+        self._packed = 0
+        self.shoe = None
+        # with keep_history every round's starting counts are kept, one entry per system
+        # per round, along with the cards left in the shoe
+        self.keep_history = keep_history
+        self.history = array('i')
+        self.history_left = array('i')
+
+    def attach(self, shoe: Shoe | CompositionShoe) -> None:
+        self.shoe = shoe
+        shoe.counter = self
+        self.sync()
+
+    def sync(self) -> None:
+        # the running counts from the shoe's rank counts
+        shoe = self.shoe
+        dealt = [full - left for full, left in zip(shoe.full_counts, shoe.counts)]
+        packed = 0
+        for i, system in enumerate(self.systems):
+            running = system.initial_count(shoe.num_decks) + sum(tag * n for tag, n in zip(system.tags, dealt))
+            packed += running << (LANE_BITS * i)
+        self._packed = packed
+
+    def add(self, rank_class: int) -> None:
+        # called by the shoe for every card it deals
+        self._packed += self._deltas[rank_class]
+
+    def running_counts(self) -> list[int]:
+        # every system's running count, in the order the systems were given
+        packed = self._packed + self._bias
+        return [((packed >> (LANE_BITS * i)) & LANE_MASK) - LANE_BIAS for i in range(len(self.systems))]
+
+    def running_count(self, name: str = 'hi-lo') -> int:
+        return (((self._packed + self._bias) >> (LANE_BITS * self._lanes[name])) & LANE_MASK) - LANE_BIAS
+
+    def true_count(self, name: str = 'hi-lo') -> float:
+        # running count over the decks left
+        decks = self.shoe.decks_remaining()
+        return self.running_count(name) / decks if decks > 0 else 0.0
+
+    def mark_round(self) -> None:
+        # called by the game before it deals a round
+        if self.keep_history:
+            self.history.extend(self.running_counts())
+            self.history_left.append(len(self.shoe))
+
+    def round_counts(self, name: str = 'hi-lo') -> array:
+        # the running count at the start of every round kept
+        return self.history[self._lanes[name]::len(self.systems)]
+
+    def round_true_counts(self, name: str = 'hi-lo') -> list[float]:
+        return [running * 52 / left if left > 0 else 0.0
+                for running, left in zip(self.round_counts(name), self.history_left)]
+
+    def clear_history(self) -> None:
+        self.history = array('i')
+        self.history_left = array('i')
+
+
+def bet_ramp(tracker: CountTracker, unit: int, spread: int, name: str = 'hi-lo'):
+    # a Simulator bet_policy: one unit up to a true count of 1, then a unit more per true
+    # count, at most spread units. A shoe about to be reshuffled bets one unit.
+    def bet(game) -> int:
+        if spread <= 1 or tracker.shoe.needs_reshuffle():
+            return unit
+        return unit * min(max(int(tracker.true_count(name)), 1), spread)
+    return bet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate with every count tracked and summarize the round counts")
+    parser.add_argument('--rounds', type=int, default=100000)
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--penetration', type=float, default=0.75)
+    parser.add_argument('--shoe', choices=SHOE_TYPES, default='array')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='basic')
+    parser.add_argument('--systems', nargs='+', choices=sorted(SYSTEMS), default=list(SYSTEMS))
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed) if args.seed is not None else None
+    simulator = Simulator(num_players=args.players, num_decks=args.decks, policy=POLICIES[args.policy], rng=rng,
+                          penetration=args.penetration, shoe_type=args.shoe)
+    tracker = CountTracker(args.systems, keep_history=True)
+    tracker.attach(simulator.game.deck)
+    start = time.perf_counter()
+    simulator.run(args.rounds)
+    elapsed = time.perf_counter() - start
+    print(f"{args.rounds} rounds in {elapsed:.2f}s ({args.rounds / elapsed:,.0f} rounds/sec)")
+    for name in args.systems:
+        true_counts = tracker.round_true_counts(name)
+        mean = sum(true_counts) / len(true_counts)
+        sd = math.sqrt(sum((tc - mean) ** 2 for tc in true_counts) / len(true_counts))
+        high = sum(tc >= 2 for tc in true_counts) / len(true_counts)
+        print(f"{name:>9}: round start true count mean {mean:+.3f}, sd {sd:.3f}, "
+              f"{high * 100:.1f}% of rounds at +2 or more")
+
+
+if __name__ == '__main__':
+    main()
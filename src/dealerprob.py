@@ -0,0 +1,95 @@
+from functools import lru_cache
+from CardClass import CARD_RANK_CLASS, Shoe
+
+# Exact odds of how the dealer's hand ends up, given the upcard and what is left in the shoe.
+# The dealer plays like Dealer.should_hit (hit below 17, and on soft 17 when hit_soft_17
+# is set) and there is no peek, so blackjack is one of the outcomes.
+
+# outcome positions in a distribution
+OUTCOMES = ('17', '18', '19', '20', '21', 'bust', 'blackjack')
+BUST = 5
+BLACKJACK = 6
+
+# memo entries kept for the dealer's draws; every (composition, hand) state is one entry
+CACHE_SIZE = 1 << 18
+
+
+def add_value(total: int, soft: bool, value: int) -> tuple[int, bool]:
+    # Hand.add_card on just a total and a soft flag
+    aces = soft + (value == 11)
+    total += value
+    while total > 21 and aces:
+        total -= 10
+        aces -= 1
+    return total, aces > 0
+
+
+# (total, soft) after each rank class is added, for every total the dealer may still hit on
+_NEXT = {(total, soft): [add_value(total, soft, value) for value in range(2, 12)]
+         for total in range(2, 18) for soft in (False, True)}
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _finish(total: int, soft: bool, counts: tuple[int, ...], infinite: bool,
+            hit_soft_17: bool = False) -> tuple[float, ...]:
+    # odds of each final total (17-21, bust) for a hand of two or more cards the dealer still hits
+    left = sum(counts)
+    result = [0.0] * 6
+    for rank_class, (next_total, next_soft) in enumerate(_NEXT[total, soft]):
+        count = counts[rank_class]
+        if not count:
+            continue
+        p = count / left
+        # finished hands are added straight in, only hands still below 17 recurse
+        if next_total > 21:
+            result[BUST] += p
+        elif next_total >= 17 and not (hit_soft_17 and next_total == 17 and next_soft):
+            result[next_total - 17] += p
+        else:
+            after = counts if infinite else counts[:rank_class] + (count - 1,) + counts[rank_class + 1:]
+            for i, q in enumerate(_finish(next_total, next_soft, after, infinite, hit_soft_17)):
+                if q:
+                    result[i] += p * q
+    return tuple(result)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def dealer_distribution(upcard: int, counts: tuple[int, ...], infinite: bool = False,
+                        hit_soft_17: bool = False) -> tuple[float, ...]:
+    # upcard is a card value (2-11), counts are Shoe.counts (rank classes 2-9, ten, ace)
+    # still to be dealt, which includes the hole card. Returns odds in OUTCOMES order.
+    left = sum(counts)
+    result = [0.0] * 7
+    up_total, up_soft = add_value(0, False, upcard)
+    for rank_class, count in enumerate(counts):
+        if not count:
+            continue
+        p = count / left
+        total, soft = add_value(up_total, up_soft, rank_class + 2)
+        if total == 21:
+            result[BLACKJACK] += p
+        elif total >= 17 and not (hit_soft_17 and total == 17 and soft):
+            result[total - 17] += p
+        else:
+            after = counts if infinite else counts[:rank_class] + (count - 1,) + counts[rank_class + 1:]
+            for i, q in enumerate(_finish(total, soft, after, infinite, hit_soft_17)):
+                result[i] += p * q
+    return tuple(result)
+
+
+def shoe_distribution(upcard: int, shoe: Shoe, hole_card=None, hit_soft_17: bool = False) -> tuple[float, ...]:
+    # the odds as seen from the table: the hole card has already left the shoe but
+    # nobody knows what it is, so it goes back into the composition
+    counts = list(shoe.counts)
+    if hole_card is not None:
+        counts[CARD_RANK_CLASS[hole_card.code]] += 1
+    return dealer_distribution(upcard, tuple(counts), getattr(shoe, 'infinite', False), hit_soft_17)
+
+
+def cache_info() -> dict:
+    return {'dealer_distribution': dealer_distribution.cache_info(), 'finish': _finish.cache_info()}
+
+
+def clear_cache() -> None:
+    dealer_distribution.cache_clear()
+    _finish.cache_clear()
@@ -1,26 +1,75 @@
-import pygame
-import sys
-import guiconstants as c
-from CardClass import Card, Deck, Dealer, Hand, Player
+from CardClass import Card, Dealer, HandPool, Player, RNG, Shoe, CompositionShoe
 from enum import Enum
+from rules import RuleSet, compile_rules
+from settlement import HandResult, Outcome, SeatResult, format_round, settle_hand
 
 class GameState(Enum):
     BETTING = 0
     PLAYER_TURN = 1
     DEALER_TURN = 2
     GAME_OVER = 3
+
+# action codes written to an action log, one byte each (bets and chip resets are followed by the amount)
+LOG_BET = ord('B')
+LOG_HIT = ord('H')
+LOG_STAND = ord('S')
+LOG_DOUBLE = ord('D')
+LOG_SPLIT = ord('P')
+LOG_SURRENDER = ord('R')
+LOG_CHIPS = ord('C')
+LOG_NEW_ROUND = ord('N')
+
+
 class BlackjackGame:
-    def __init__(self, num_players: int = 1, num_decks: int = 6, initial_chips: int = 1000):
-        self.deck = Deck(num_decks)
+    def __init__(self, num_players: int = 1, num_decks: int = 6, initial_chips: int = 1000, headless: bool = False,
+                 rng: RNG | None = None, penetration: float = 0.75,
+                 shoe: Shoe | CompositionShoe | None = None, action_log=None, rules: RuleSet | None = None):
+        # every shuffle of the shoe uses the same generator
+        self.rng = rng
+        # every accepted action is recorded here when set (see replay.ActionLog)
+        self.action_log = action_log
+        # a prebuilt shoe (e.g. a CompositionShoe for huge or infinite decks) replaces the default one
+        if shoe is None:
+            shoe = Shoe(num_decks, penetration, rng)
+        # a round is reshuffled for when fewer than five cards a hand are left, so the shoe
+        # has to hold at least that many
+        if not getattr(shoe, 'infinite', False) and shoe.size < (num_players + 1) * 5:
+            raise ValueError(f"A {shoe.num_decks} deck shoe can't deal to {num_players} seats, "
+                             f"it needs at least {(num_players + 1) * 5} cards")
+        self.deck = shoe
+        self.num_decks = shoe.num_decks
+        self.penetration = shoe.penetration
+        # headless games (simulations) skip building the per-action messages and printing
+        self.headless = headless
         # Added multiple players
-        self.players = [Player(f"Player {i+1}", chips=initial_chips) for i in range(num_players)]
+        # one pool of spare split hands for the whole table
+        self.hand_pool = HandPool()
+        self.players = [Player(f"Player {i+1}", chips=initial_chips, hand_pool=self.hand_pool) for i in range(num_players)]
         self.num_players = num_players
         self.current_player_index = 0
-        self.dealer = Dealer()
+        # the table rules, compiled into the lookup tables the rounds are played from
+        self.rules = rules if rules is not None else RuleSet()
+        self.rule_tables = compile_rules(self.rules)
+        self.dealer = Dealer(self.rule_tables.dealer_hits)
         self.state = GameState.BETTING
+        # per seat and hand outcomes of the last round settled (see settlement.py)
+        self.round_result = []
         self.message = f"{self.get_current_player().name}, place your bet!" if self.players else "Place your bet!"
         # Flag to check if all players have placed their bets
         self.all_bets_placed = False 
+        self.cards_on_table = 0
+        self.live_hands = 0
+
+    @property
+    def message(self) -> str:
+        # the end of round summary is formatted from round_result the first time it is asked for
+        if self._message is None:
+            self._message = format_round(self.round_result)
+        return self._message
+
+    @message.setter
+    def message(self, text: str) -> None:
+        self._message = text
 
     # Get the current player based on the index
     def get_current_player(self) -> Player | None:
@@ -98,12 +147,16 @@ class BlackjackGame:
             return False # Bet failed
         
         # Bet successfully placed for current_player
-        print(f"{current_player.name} bet ${bet_amount}. Chips left: ${current_player.chips}")
+        if self.action_log is not None:
+            self.action_log.record(LOG_BET, bet_amount)
+        if not self.headless:
+            print(f"{current_player.name} bet ${bet_amount}. Chips left: ${current_player.chips}")
 
         self.current_player_index += 1
         if self.current_player_index < self.num_players:
-            next_player = self.get_current_player()
-            self.message = f"{next_player.name}, place your bet!"
+            if not self.headless:
+                next_player = self.get_current_player()
+                self.message = f"{next_player.name}, place your bet!"
             return True # Bet accepted, moved to next player for betting
         else:
             # All players have placed their bets
@@ -116,52 +169,82 @@ class BlackjackGame:
     def _deal_initial_cards_and_setup_play(self):
         # Reset hands for all players and dealer (bets are already placed and stored)
         for player in self.players:
-            player.hands = [Hand()]
-            player.current_hand_index = 0
+            player.reset_hands()
 
         self.dealer.hand.clear()
+        # kept up to date as cards are drawn and hands finish, so no step of the round has to scan the table
+        self.cards_on_table = 0
+        self.live_hands = 0
         
-        # Reshuffle if running low on cards
-        if len(self.deck) < (self.num_players + 1) * 5: # Adjusted threshold
-            self.deck = Deck(6) # Or your configured num_decks
+        # Reshuffle once the cut card is out, or if there may not be enough cards for the round
+        if self.deck.needs_reshuffle() or len(self.deck) < (self.num_players + 1) * 5:
+            self._reshuffle()
+        # the count before this round's cards come out
+        if self.deck.counter is not None:
+            self.deck.counter.mark_round()
         
         # Dealing sequence
         # One card to each player, face up.
         for player in self.players:
-            player.hands[0].add_card(self.deck.deal()) # Add to the first hand
+            player.hands[0].add_card(self._draw_card()) # Add to the first hand
 
         # Dealer's first card, face up.
-        self.dealer.hand.add_card(self.deck.deal())
+        self.dealer.hand.add_card(self._draw_card())
         
         # Second card to each player, face up.
         for player in self.players:
-            player.hands[0].add_card(self.deck.deal())
+            player.hands[0].add_card(self._draw_card())
 
         # Dealer's second card, face down.
-        dealer_second_card = self.deck.deal()
-        dealer_second_card.face_up = False
-        self.dealer.hand.add_card(dealer_second_card)
+        dealer_second_card = self._draw_card()
+        self.dealer.hand.add_card(dealer_second_card, face_up=False)
 
         # Transition to the first player's turn
         self.state = GameState.PLAYER_TURN
+        # a dealer who peeks ends the round on a blackjack before anyone plays
+        if self.rule_tables.dealer_peeks and self.dealer.hand.blackjack:
+            self.current_player_index = self.num_players
+            self.start_dealer_turn()
+            return
         self.current_player_index = -1 # Will be incremented by next_player_or_dealer first
         self.next_player_or_dealer() # This will set message and handle initial BJs
 
+    def _reshuffle(self) -> None:
+        # shuffle the discards back into the shoe, cards still on the table stay out
+        self.deck.reshuffle(self.cards_on_table)
+
+    def _draw_card(self) -> Card:
+        # a long round can still empty the shoe after the reshuffle check, so reshuffle mid-round
+        card = self.deck.deal()
+        if card is None:
+            self._reshuffle()
+            card = self.deck.deal()
+            if card is None:
+                raise ValueError(f"The shoe ran out with all {self.cards_on_table} of its cards on the table")
+        self.cards_on_table += 1
+        return card
+
     def hit(self) -> None:
         current_player = self.get_current_player()
         #take another card
         if self.state != GameState.PLAYER_TURN or not current_player:
             self.message = "Cannot hit right now!"
             return
+        if self._split_aces_locked(current_player):
+            self.message = "Split aces can't take more cards!"
+            return
+        if self.action_log is not None:
+            self.action_log.record(LOG_HIT)
         
         current_hand = current_player.current_hand
-        current_hand.add_card(self.deck.deal())
+        current_hand.add_card(self._draw_card())
         
-        if current_hand.value > 21:
-            self.message = f"{current_player.name} busts! Hand value: {current_hand.value}"
+        if current_hand.bust:
+            if not self.headless:
+                self.message = f"{current_player.name} busts! Hand value: {current_hand.value}"
             # move to next hand or player or dealer's turn
             self.next_hand_or_player()
-        else:
+        elif not self.headless:
             self.message = f"{current_player.name} hits. Hand value: {current_hand.value}"
 
     def stand(self) -> None:
@@ -170,9 +253,12 @@ class BlackjackGame:
         if self.state != GameState.PLAYER_TURN or not current_player:
             self.message = "Cannot stand right now!"
             return
+        if self.action_log is not None:
+            self.action_log.record(LOG_STAND)
         
         # move to next hand or dealer's turn
-        self.message = f"{current_player.name} stands."
+        if not self.headless:
+            self.message = f"{current_player.name} stands."
         self.next_hand_or_player()
     
     def double_down(self) -> None:
@@ -188,19 +274,26 @@ class BlackjackGame:
         if len(current_hand.cards) != 2:
             self.message = "Can only double down on the initial two cards!"
             return
+        if not self._double_allowed(current_player):
+            self.message = "The table rules don't allow doubling down on this hand!"
+            return
         
         current_bet = current_player.bets[current_hand_index]
         if not current_player.place_bet(current_bet, current_hand_index): # place_bet doubles the bet on that hand
             self.message = f"{current_player.name}: Not enough chips to double down!"
             return
         
+        if self.action_log is not None:
+            self.action_log.record(LOG_DOUBLE)
+
         # take one final card and end turn
-        current_hand.add_card(self.deck.deal())
+        current_hand.add_card(self._draw_card())
         
-        if current_hand.value > 21:
-            self.message = f"{current_player.name} busts on double down! Hand value: {current_hand.value}"
-        else:
-            self.message = f"{current_player.name} doubled down. Hand value: {current_hand.value}"
+        if not self.headless:
+            if current_hand.bust:
+                self.message = f"{current_player.name} busts on double down! Hand value: {current_hand.value}"
+            else:
+                self.message = f"{current_player.name} doubled down. Hand value: {current_hand.value}"
         
         # move to next hand or dealer's turn
         self.next_hand_or_player()
@@ -213,15 +306,92 @@ class BlackjackGame:
             return
         
         # This method in Player class should handle placing the additional bet
-        if current_player.split_hand(): 
+        if self._split_allowed(current_player) and current_player.split_hand(): 
+            if self.action_log is not None:
+                self.action_log.record(LOG_SPLIT)
             # Deal to first split hand
-            current_player.hands[current_player.current_hand_index].add_card(self.deck.deal())
+            current_player.hands[current_player.current_hand_index].add_card(self._draw_card())
             # Deal to the second split hand (now the next hand in the list for that player)
-            current_player.hands[current_player.current_hand_index + 1].add_card(self.deck.deal())
-            self.message = f"{current_player.name} split. Playing hand {current_player.current_hand_index + 1}. Value: {current_player.current_hand.value}"
+            current_player.hands[current_player.current_hand_index + 1].add_card(self._draw_card())
+            if not self.headless:
+                self.message = f"{current_player.name} split. Playing hand {current_player.current_hand_index + 1}. Value: {current_player.current_hand.value}"
             # Player continues playing the current hand. next_hand_or_player will handle moving to the second split hand.
+            if self._split_aces_done(current_player):
+                self.next_hand_or_player()
         else:
             self.message = "Cannot split this hand!"
+
+    def surrender(self) -> None:
+        # give up the hand for half the bet back (first two cards only, where the rules allow it)
+        current_player = self.get_current_player()
+        if self.state != GameState.PLAYER_TURN or not current_player:
+            self.message = "Cannot surrender right now!"
+            return
+        if not self.can_surrender():
+            self.message = "Can't surrender this hand!"
+            return
+        if self.action_log is not None:
+            self.action_log.record(LOG_SURRENDER)
+        current_player.surrendered = True
+        if not self.headless:
+            self.message = f"{current_player.name} surrenders."
+        self.next_hand_or_player()
+
+    # What the table rules allow for the hand being played, all answered from rule_tables.
+    # The can_ methods also check the player has the chips for it.
+    def _double_allowed(self, player: Player) -> bool:
+        tables = self.rule_tables
+        if not tables.double_states[player.current_hand.state]:
+            return False
+        if len(player.hands) > 1 and not tables.double_after_split:
+            return False
+        return not self._split_aces_locked(player)
+
+    def _split_allowed(self, player: Player) -> bool:
+        tables = self.rule_tables
+        if len(player.hands) >= tables.max_hands:
+            return False
+        return len(player.hands) == 1 or tables.resplit_aces or not player.current_hand.cards[0].is_ace
+
+    def _split_aces_locked(self, player: Player) -> bool:
+        # a hand from split aces that may not be hit or doubled
+        return (not self.rule_tables.hit_split_aces and len(player.hands) > 1
+                and player.current_hand.cards[0].is_ace)
+
+    def _split_aces_done(self, player: Player) -> bool:
+        # a locked split ace hand with nothing left to do (it can't be resplit either)
+        return self._split_aces_locked(player) and not self.can_split()
+
+    def can_hit(self) -> bool:
+        if self.state != GameState.PLAYER_TURN:
+            return False
+        return not self._split_aces_locked(self.players[self.current_player_index])
+
+    def can_double(self) -> bool:
+        if self.state != GameState.PLAYER_TURN:
+            return False
+        player = self.players[self.current_player_index]
+        if player.chips < player.bets[player.current_hand_index]:
+            return False
+        # an unsplit hand only needs the table lookup
+        if len(player.hands) == 1:
+            return self.rule_tables.double_states[player.hands[0].state]
+        return self._double_allowed(player)
+
+    def can_split(self) -> bool:
+        if self.state != GameState.PLAYER_TURN:
+            return False
+        player = self.players[self.current_player_index]
+        cards = player.current_hand.cards
+        if len(cards) != 2 or cards[0].value != cards[1].value:
+            return False
+        return self._split_allowed(player) and player.chips >= player.bets[player.current_hand_index]
+
+    def can_surrender(self) -> bool:
+        if not self.rule_tables.surrender or self.state != GameState.PLAYER_TURN:
+            return False
+        player = self.players[self.current_player_index]
+        return len(player.hands) == 1 and len(player.current_hand.cards) == 2
     
     def next_hand_or_player(self) -> None:
         # move to the next hand if we have one, otherwise dealer's turn
@@ -229,33 +399,43 @@ class BlackjackGame:
         current_player = self.get_current_player()
         if not current_player: return
 
-        if len(current_player.current_hand.cards) == 1:
-            current_player.current_hand.add_card(self.deck.deal())
+        current_hand = current_player.current_hand
+        if len(current_hand.cards) == 1:
+            current_hand.add_card(self._draw_card())
+        # this hand is finished, the dealer has to play if it is still standing
+        if not current_hand.bust and not current_hand.blackjack and not current_player.surrendered:
+            self.live_hands += 1
 
         # Check if current player has more hands to play (due to splitting)
         if current_player.current_hand_index < len(current_player.hands) - 1:
             current_player.current_hand_index += 1
             # Deal one card to the new current hand if it's a result of a split and only has one card
             if len(current_player.current_hand.cards) == 1:
-                 current_player.current_hand.add_card(self.deck.deal())
-            self.message = f"{current_player.name}, playing hand {current_player.current_hand_index + 1}. Value: {current_player.current_hand.value}"
+                 current_player.current_hand.add_card(self._draw_card())
+            if not self.headless:
+                self.message = f"{current_player.name}, playing hand {current_player.current_hand_index + 1}. Value: {current_player.current_hand.value}"
+            if self._split_aces_done(current_player):
+                self.next_hand_or_player()
         else:
             # Current player has finished all their hands, move to the next player
             self.next_player_or_dealer()
     
     def next_player_or_dealer(self) -> None:
+        # a loop rather than recursion, so a long run of blackjacks at a big table can't overflow the stack
         self.current_player_index += 1
-        if self.current_player_index < self.num_players:
-            current_player = self.get_current_player()
-            self.message = f"{current_player.name}'s turn. Hit, Stand, Double, or Split?"
+        while self.current_player_index < self.num_players:
+            current_player = self.players[self.current_player_index]
             # Check for Blackjack for the new current player
-            if current_player.current_hand.is_blackjack():
+            if not current_player.current_hand.blackjack:
+                if not self.headless:
+                    self.message = f"{current_player.name}'s turn. Hit, Stand, Double, or Split?"
+                return
+            if not self.headless:
                 self.message = f"{current_player.name} has Blackjack!"
-                # Recursively move if next player also has BJ
-                self.next_player_or_dealer() 
-        else:
-            # All players have played, dealer's turn now
-            self.start_dealer_turn()
+            # move on if this player has BJ
+            self.current_player_index += 1
+        # All players have played, dealer's turn now
+        self.start_dealer_turn()
 
     def start_dealer_turn(self) -> None:
         self.state = GameState.DEALER_TURN
@@ -263,20 +443,10 @@ class BlackjackGame:
         if not self.dealer.hand.cards or len(self.dealer.hand.cards) < 2: # Should not happen !!!
             self.end_round()
             return
-        self.dealer.hand.cards[1].face_up = True
+        self.dealer.reveal_hole_card()
         
-        all_players_busted_or_blackjack = True
-        for player in self.players:
-            player_has_active_hand = False
-            for hand in player.hands:
-                if hand.value <= 21 and not hand.is_blackjack(): # Only consider hands that need dealer to play
-                    player_has_active_hand = True
-                    break
-            if player_has_active_hand:
-                all_players_busted_or_blackjack = False
-                break
-        
-        if all_players_busted_or_blackjack:
+        # live_hands counts the finished hands that are neither busted nor blackjack
+        if not self.live_hands:
             self.message = "All player hands are Busted or Blackjack. Resolving bets."
             self.end_round()
             return
@@ -286,7 +456,7 @@ class BlackjackGame:
     def play_dealer_hand(self) -> None:
         # dealer plays by the book, hitting until they have 17 or more
         while self.dealer.should_hit():
-            self.dealer.hand.add_card(self.deck.deal())
+            self.dealer.hand.add_card(self._draw_card())
         
         self.end_round()
     
@@ -294,56 +464,57 @@ class BlackjackGame:
         # determine the winner and update chips
         self.state = GameState.GAME_OVER
         dealer_value = self.dealer.hand.value
-        dealer_busted = dealer_value > 21
-        is_dealer_blackjack = self.dealer.hand.is_blackjack()
-        
-        round_summary_parts = []
+        dealer_busted = self.dealer.hand.bust
+        is_dealer_blackjack = self.dealer.hand.blackjack
+        payouts = self.rule_tables.payouts
+        payout_unit = self.rule_tables.payout_unit
 
-        # have to loop through all players and their hands to resolve bets
+        results = []
         for player in self.players:
-            player_chips_change = 0 # To summarize total win/loss for the player this round
-            player_specific_messages = []
+            hands = []
             for i, hand in enumerate(player.hands):
                 bet = player.bets[i]
-                hand_label = f"{player.name} Hand {i+1}" if len(player.hands) > 1 else player.name
-
-                if hand.is_blackjack():
-                    if is_dealer_blackjack:
-                        player_specific_messages.append(f"{hand_label}: Push (Both Blackjack)")
-                        player.add_chips(bet) # Return bet
-                    else:
-                        blackjack_payout = int(bet * 2.5)
-                        player.add_chips(blackjack_payout)
-                        player_chips_change += (blackjack_payout - bet)
-                        player_specific_messages.append(f"{hand_label}: Blackjack! Wins ${blackjack_payout - bet}")
-                elif hand.value > 21:
-                    player_specific_messages.append(f"{hand_label}: Bust! Loses ${bet}")
-                    player_chips_change -= bet # Already deducted by place_bet, so this is for summary if needed. Chips are already gone.
-                elif is_dealer_blackjack: # Player no BJ, Dealer has BJ
-                    player_specific_messages.append(f"{hand_label}: Loses ${bet} (Dealer Blackjack)")
-                    player_chips_change -= bet
-                elif dealer_busted:
-                    player.add_chips(bet * 2)
-                    player_chips_change += bet
-                    player_specific_messages.append(f"{hand_label}: Wins ${bet} (Dealer Busts)")
-                elif hand.value > dealer_value:
-                    player.add_chips(bet * 2)
-                    player_chips_change += bet
-                    player_specific_messages.append(f"{hand_label}: Wins ${bet}")
-                elif hand.value < dealer_value:
-                    player_specific_messages.append(f"{hand_label}: Loses ${bet}")
-                    player_chips_change -= bet
-                else: # Push (hand.value == dealer_value, neither has BJ if we reached here, or both non-BJ with same value)
-                    player.add_chips(bet)
-                    player_specific_messages.append(f"{hand_label}: Push")
-            
-            if player_specific_messages:
-                 round_summary_parts.append(". ".join(player_specific_messages) + f". {player.name} Chips: ${player.chips}")
+                if player.surrendered:
+                    outcome = Outcome.SURRENDER
+                else:
+                    outcome = settle_hand(hand.value, hand.bust, hand.blackjack, dealer_value, dealer_busted,
+                                          is_dealer_blackjack)
+                paid = bet * payouts[outcome] // payout_unit
+                player.add_chips(paid)
+                hands.append(HandResult(outcome, bet, paid))
+            results.append(SeatResult(player.name, player.chips, hands))
+        self.round_result = results
+        # the summary is only built if something reads self.message
+        self._message = None
+
+    def snapshot(self) -> tuple:
+        # the whole table mid-round (shoe, hands, bets, chips, whose turn it is) as plain
+        # tuples, for rollouts and search: restore it, play on, restore it again.
+        # The random generator isn't included.
+        return (self.deck, self.deck.snapshot(), self.state, self.current_player_index, self.all_bets_placed,
+                self.cards_on_table, self.live_hands, self.round_result, self._message,
+                tuple(player.snapshot() for player in self.players), self.dealer.hand.snapshot())
+
+    def restore(self, snapshot: tuple) -> None:
+        (self.deck, deck_state, self.state, self.current_player_index, self.all_bets_placed,
+         self.cards_on_table, self.live_hands, self.round_result, self._message,
+         players, dealer_hand) = snapshot
+        self.deck.restore(deck_state)
+        for player, player_state in zip(self.players, players):
+            player.restore(player_state)
+        self.dealer.hand.restore(dealer_hand)
+
+    def reset_chips(self, chips: int) -> None:
+        # put every player's stack back to this amount (simulations start each round from the same bankroll)
+        if self.action_log is not None:
+            self.action_log.record(LOG_CHIPS, chips)
+        for player in self.players:
+            player.chips = chips
 
-        self.message = "Round Over: " + " | ".join(round_summary_parts) if round_summary_parts else "Round Over. No bets resolved."
-    
     def new_round(self) -> None:
         # reset everything
+        if self.action_log is not None:
+            self.action_log.record(LOG_NEW_ROUND)
         self.state = GameState.BETTING
         self.all_bets_placed = False
         self.current_player_index = 0
@@ -351,7 +522,43 @@ class BlackjackGame:
             player.clear_hands()
 
         self.dealer.hand.clear()
+        if self.headless:
+            return
         if self.players:
             self.message = f"{self.players[0].name}, place your bet!"
         else:
             self.message = "No players to start a new round."
+
+
+class RoundListener:
+    # Base for anything hooked into a game's action_log: each settled round goes to add_round,
+    # every other action to on_action, and all of it is passed on to the hook it replaced.
+
+    def __init__(self):
+        self.game = None
+        self._forward = None
+
+    def attach(self, game: BlackjackGame) -> None:
+        self.game = game
+        self._forward = game.action_log
+        game.action_log = self
+
+    def record(self, code: int, amount: int | None = None) -> None:
+        # the game's action_log hook
+        if code == LOG_NEW_ROUND:
+            self.add_round(self.game)
+        else:
+            self.on_action(code, amount)
+        if self._forward is not None:
+            self._forward.record(code, amount)
+
+    def on_action(self, code: int, amount: int | None) -> None:
+        pass
+
+    def add_round(self, game: BlackjackGame) -> None:
+        raise NotImplementedError
+
+    def finish_round(self) -> None:
+        # a round that finished but was never followed by new_round still counts
+        if self.game is not None and self.game.state == GameState.GAME_OVER:
+            self.add_round(self.game)
@@ -430,8 +430,8 @@ class GUI:
         start_x = x_center - total_hand_width // 2
 
         # draw each card in the hand
-        for i, card_game_obj in enumerate(hand_obj.cards):
-            card_key = card_game_obj.get_image_key()
+        for i in range(num_cards):
+            card_key = hand_obj.get_image_key(i)
             card_image_surface = self.card_images.get(card_key)
 
             if card_image_surface:
@@ -611,7 +611,7 @@ class GUI:
                     # Display dealer's score only if cards exist
                     if self.game.dealer.hand and self.game.dealer.hand.cards: 
                         value_text = ""
-                        if self.game.state == GameState.PLAYER_TURN and len(self.game.dealer.hand.cards) == 2 and not self.game.dealer.hand.cards[1].face_up:
+                        if self.game.state == GameState.PLAYER_TURN and len(self.game.dealer.hand.cards) == 2 and not self.game.dealer.hand.is_face_up(1):
                             value_text = f"Value: {self.game.dealer.hand.cards[0].value} + ?"
                         else: 
                             value_text = f"Value: {self.game.dealer.hand.value}"
@@ -0,0 +1,277 @@
+import argparse
+import os
+import random
+import struct
+import time
+from typing import NamedTuple
+import numpy as np
+from gamelogic import BlackjackGame, RoundListener, LOG_HIT, LOG_STAND, LOG_DOUBLE, LOG_SPLIT, LOG_SURRENDER
+from CardClass import HI_LO_TAGS
+from rules import RuleSet, parse_rules
+from settlement import Outcome
+from simulation import Simulator, POLICIES, SHOE_TYPES, format_report
+
+# Append-only round history. Every finished round is one fixed-size record: the dealer's
+# cards, and for each seat its actions, net and wagered, and up to MAX_HANDS hands with
+# their cards, bet, payout and outcome (rounds that don't fit are flagged truncated).
+# Each action also keeps the hand's total and soft/pair flags when it was chosen, and
+# each round the Hi-Lo true count it started at. The table rules (RuleSet.describe) follow
+# the file header.
+# Cards are card codes (0-51) packed 6 bits each, actions are 3 bits each. The reader
+# memory-maps the file as a NumPy structured array, so scanning it is array work and
+# nothing is parsed.
+
+MAGIC = b'BJHST3'
+# file header: magic, seats per record, hand slots per seat, card slots per hand, decks in
+# the shoe, length of the rules text that follows
+HEADER = struct.Struct('<6sHBBHH')
+
+MAX_HANDS = 4
+MAX_CARDS = 12
+CARD_BYTES = MAX_CARDS * 6 // 8
+MAX_ACTIONS = 16
+
+# 3-bit action codes in a seat's action word, first action in the lowest bits
+ACTION_BITS = {LOG_HIT: 0, LOG_STAND: 1, LOG_DOUBLE: 2, LOG_SPLIT: 3, LOG_SURRENDER: 4}
+ACTION_LETTERS = 'HSDPR'
+ACTION_WIDTH = 3
+ACTION_MASK = (1 << ACTION_WIDTH) - 1
+
+# each action's situation in one byte: the hand's total before acting, then soft and pair flags
+SOFT_FLAG = 1 << 5
+PAIR_FLAG = 1 << 6
+TOTAL_MASK = SOFT_FLAG - 1
+
+ROUND_PREFIX = struct.Struct(f'<{CARD_BYTES}sBBf')
+SEAT_PREFIX = struct.Struct(f'<BBQqq{MAX_ACTIONS}s')
+HAND_RECORD = struct.Struct(f'<{CARD_BYTES}sBIIB')
+EMPTY_HAND = bytes(HAND_RECORD.size)
+
+# flush to disk once this much is buffered
+BUFFER_BYTES = 1 << 20
+
+
+class HistoryHeader(NamedTuple):
+    num_seats: int
+    max_hands: int
+    max_cards: int
+    num_decks: int
+    rules: RuleSet
+    # where the first record starts
+    offset: int
+
+
+def read_header(path: str) -> HistoryHeader:
+    with open(path, 'rb') as f:
+        data = f.read(HEADER.size)
+        if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a round history")
+        _, seats, max_hands, max_cards, decks, rules_size = HEADER.unpack(data)
+        rules = parse_rules(f.read(rules_size).decode())
+    return HistoryHeader(seats, max_hands, max_cards, decks, rules, HEADER.size + rules_size)
+
+
+def record_dtype(num_seats: int, max_hands: int = MAX_HANDS) -> np.dtype:
+    # the same layout as the struct packing below, field for field with no padding
+    hand = np.dtype([('cards', 'u1', (CARD_BYTES,)), ('num_cards', 'u1'), ('bet', '<u4'),
+                     ('payout', '<u4'), ('outcome', 'u1')])
+    seat = np.dtype([('num_hands', 'u1'), ('num_actions', 'u1'), ('actions', '<u8'), ('net', '<i8'),
+                     ('wagered', '<i8'), ('situations', 'u1', (MAX_ACTIONS,)), ('hands', hand, (max_hands,))])
+    return np.dtype([('dealer_cards', 'u1', (CARD_BYTES,)), ('dealer_num_cards', 'u1'),
+                     ('truncated', 'u1'), ('true_count', '<f4'), ('seats', seat, (num_seats,))])
+
+
+def _situation(hand, code: int) -> int:
+    # the hand as it was when the action was chosen; a split is logged once the pair is
+    # already apart, so its pair is rebuilt from the card left in the hand
+    if code == LOG_SPLIT:
+        value = hand.cards[0].value
+        return (12 | SOFT_FLAG if value == 11 else 2 * value) | PAIR_FLAG
+    cards = hand.cards
+    pair = len(cards) == 2 and cards[0].value == cards[1].value
+    return min(hand.value, TOTAL_MASK) | (SOFT_FLAG if hand.soft else 0) | (PAIR_FLAG if pair else 0)
+
+
+def round_start_count(game: BlackjackGame, tags=HI_LO_TAGS) -> float:
+    # Hi-Lo true count before this round's cards came out: the shoe's count now, less the
+    # cards on the table (after a reshuffle that leaves the count of a fresh shoe)
+    deck = game.deck
+    if getattr(deck, 'infinite', False):
+        return 0.0
+    on_table = [game.dealer.hand.cards] + [hand.cards for player in game.players for hand in player.hands]
+    running = deck.running_count(tags) - sum(tags[card.rank_class] for cards in on_table for card in cards)
+    decks = (len(deck) + game.cards_on_table) / 52
+    return running / decks if decks else 0.0
+
+
+def _pack_cards(cards) -> bytes:
+    packed = 0
+    for i, card in enumerate(cards[:MAX_CARDS]):
+        packed |= card.code << (6 * i)
+    return packed.to_bytes(CARD_BYTES, 'little')
+
+
+class HistoryWriter(RoundListener):
+    # Attached to a game it sees every action (it sits in front of any action log the game
+    # already has) and writes the round out when new_round is called.
+
+    def __init__(self, path: str, num_seats: int, num_decks: int = 6, rules: RuleSet | None = None):
+        super().__init__()
+        self.path = path
+        self.num_seats = num_seats
+        self.num_decks = num_decks
+        self.rules = rules if rules is not None else RuleSet()
+        self._actions = [[] for _ in range(num_seats)]
+        self._situations = [bytearray() for _ in range(num_seats)]
+        self._buffer = bytearray()
+        self.rounds = 0
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            header = read_header(path)
+            if header[:5] != (num_seats, MAX_HANDS, MAX_CARDS, num_decks, self.rules):
+                raise ValueError(f"{path} is not a round history for {num_seats} seats and {num_decks} decks "
+                                 f"under {self.rules.describe()}")
+        self._file = open(path, 'ab')
+        if not exists:
+            rules = self.rules.describe().encode()
+            self._file.write(HEADER.pack(MAGIC, num_seats, MAX_HANDS, MAX_CARDS, num_decks, len(rules)) + rules)
+
+    def on_action(self, code: int, amount: int | None) -> None:
+        if code in ACTION_BITS:
+            seat = self.game.current_player_index
+            self._actions[seat].append(ACTION_BITS[code])
+            self._situations[seat].append(_situation(self.game.players[seat].current_hand, code))
+
+    def add_round(self, game: BlackjackGame) -> None:
+        # append the round the game has just settled
+        dealer_cards = game.dealer.hand.cards
+        truncated = len(dealer_cards) > MAX_CARDS
+        parts = []
+        for player, seat_result, actions, situations in zip(game.players, game.round_result, self._actions,
+                                                            self._situations):
+            hands = player.hands
+            truncated |= len(hands) > MAX_HANDS or len(actions) > MAX_ACTIONS
+            packed_actions = 0
+            for i, action in enumerate(actions[:MAX_ACTIONS]):
+                packed_actions |= action << (ACTION_WIDTH * i)
+            # the seat's totals cover every hand, even split hands past MAX_HANDS
+            wagered = sum(result.bet for result in seat_result.hands)
+            net = sum(result.payout for result in seat_result.hands) - wagered
+            parts.append(SEAT_PREFIX.pack(min(len(hands), MAX_HANDS), min(len(actions), MAX_ACTIONS), packed_actions,
+                                          net, wagered, bytes(situations[:MAX_ACTIONS])))
+            for hand, (outcome, bet, paid) in zip(hands[:MAX_HANDS], seat_result.hands):
+                truncated |= len(hand.cards) > MAX_CARDS
+                parts.append(HAND_RECORD.pack(_pack_cards(hand.cards), min(len(hand.cards), MAX_CARDS), bet, paid, outcome))
+            parts.append(EMPTY_HAND * (MAX_HANDS - len(hands)))
+            actions.clear()
+            situations.clear()
+        buffer = self._buffer
+        buffer += ROUND_PREFIX.pack(_pack_cards(dealer_cards), min(len(dealer_cards), MAX_CARDS), truncated,
+                                    round_start_count(game))
+        buffer += b''.join(parts)
+        self.rounds += 1
+        if len(buffer) >= BUFFER_BYTES:
+            self.flush()
+
+    def flush(self) -> None:
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+
+    def close(self) -> None:
+        self.finish_round()
+        self.flush()
+        self._file.close()
+
+    def __enter__(self) -> 'HistoryWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_history(path: str) -> np.ndarray:
+    # every complete record in the file, memory-mapped (nothing is read until it is used)
+    header = read_header(path)
+    if header.max_cards != MAX_CARDS:
+        raise ValueError(f"{path} is not a round history")
+    dtype = record_dtype(header.num_seats, header.max_hands)
+    # a record cut short by a crash mid-write is left out
+    count = (os.path.getsize(path) - header.offset) // dtype.itemsize
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=header.offset, shape=(count,))
+
+
+def unpack_cards(packed: np.ndarray) -> np.ndarray:
+    # packed card fields (..., CARD_BYTES) to card codes (..., MAX_CARDS); use num_cards
+    # to know how many are real, unused slots come out as 0
+    groups = packed.reshape(packed.shape[:-1] + (CARD_BYTES // 3, 3)).astype(np.uint32)
+    words = groups[..., 0] | (groups[..., 1] << 8) | (groups[..., 2] << 16)
+    codes = (words[..., np.newaxis] >> np.array([0, 6, 12, 18], dtype=np.uint32)) & 63
+    return codes.reshape(packed.shape[:-1] + (MAX_CARDS,)).astype(np.uint8)
+
+
+def unpack_actions(actions: int, num_actions: int) -> str:
+    # one seat's action word as letters (H, S, D, P, R) in the order they were taken
+    return ''.join(ACTION_LETTERS[(actions >> (ACTION_WIDTH * i)) & ACTION_MASK] for i in range(num_actions))
+
+
+def summarize(records: np.ndarray) -> str:
+    # totals straight from the arrays
+    seats = records['seats']
+    hands = seats['hands']
+    played = np.arange(hands.shape[-1]) < seats['num_hands'][..., np.newaxis]
+    net = seats['net'].sum(axis=0)
+    wagered = seats['wagered'].sum(axis=0)
+    outcomes = np.bincount(hands['outcome'][played], minlength=len(Outcome))
+    lines = [f"{len(records)} rounds, {int(records['truncated'].sum())} truncated"]
+    for seat, (seat_net, seat_wagered) in enumerate(zip(net, wagered)):
+        edge = seat_net / seat_wagered * 100 if seat_wagered else 0.0
+        lines.append(f"Seat {seat + 1}: net ${seat_net} on ${seat_wagered} wagered ({edge:+.3f}%)")
+    lines.append(", ".join(f"{outcome.name.lower()} {count}" for outcome, count in zip(Outcome, outcomes)))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary round history")
+    commands = parser.add_subparsers(dest='command', required=True)
+    write = commands.add_parser('write', help="simulate rounds and append them to a history file")
+    write.add_argument('path')
+    write.add_argument('--rounds', type=int, default=100000)
+    write.add_argument('--players', type=int, default=1)
+    write.add_argument('--decks', type=int, default=6)
+    write.add_argument('--penetration', type=float, default=0.75)
+    write.add_argument('--shoe', choices=SHOE_TYPES, default='array')
+    write.add_argument('--bet', type=int, default=10)
+    write.add_argument('--policy', choices=sorted(POLICIES), default='basic')
+    write.add_argument('--seed', type=int, default=None)
+    write.add_argument('--rules', type=parse_rules, default=RuleSet(), help="e.g. h17,6:5,peek,ls")
+    scan = commands.add_parser('scan', help="summarize a history file")
+    scan.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'write':
+        rng = random.Random(args.seed) if args.seed is not None else None
+        simulator = Simulator(num_players=args.players, num_decks=args.decks, bet=args.bet,
+                              policy=POLICIES[args.policy], rng=rng, penetration=args.penetration,
+                              shoe_type=args.shoe, rules=args.rules)
+        start = time.perf_counter()
+        with HistoryWriter(args.path, args.players, args.decks, args.rules) as writer:
+            writer.attach(simulator.game)
+            seats = simulator.run(args.rounds)
+        elapsed = time.perf_counter() - start
+        print(format_report(seats, args.rounds, elapsed))
+        return
+
+    start = time.perf_counter()
+    records = read_history(args.path)
+    report = summarize(records)
+    elapsed = time.perf_counter() - start
+    print(f"{read_header(args.path).rules.describe()}")
+    print(report)
+    print(f"Scanned in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
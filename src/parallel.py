@@ -0,0 +1,90 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from simulation import Simulator, SeatStats, POLICIES, SHOE_TYPES, format_report
+from stats import StatsCollector, format_stats
+from rng import RNG_KINDS, make_rng
+from rules import RuleSet, parse_rules
+
+# Runs headless simulations on every core. Each worker plays its share of the rounds with
+# its own seeded stream (see rng.py), so a (seed, workers) pair always reproduces the same totals.
+
+
+def worker_rng(seed: int, worker: int, kind: str = 'mt'):
+    # stream number worker of the seed; for 'mt' the string seed is hashed (sha512) by random.Random
+    return make_rng(seed, worker, kind)
+
+
+def split_rounds(rounds: int, workers: int) -> list[int]:
+    # share the rounds out as evenly as possible, the first workers take the remainder
+    share, extra = divmod(rounds, workers)
+    return [share + (1 if i < extra else 0) for i in range(workers)]
+
+
+def _run_worker(rounds: int, seed: int, worker: int, num_players: int, num_decks: int,
+                bet: int, policy_name: str, penetration: float, shoe_type: str,
+                collect_stats: bool = False, rng_kind: str = 'mt',
+                rules: RuleSet | None = None) -> tuple[list[SeatStats], StatsCollector | None]:
+    simulator = Simulator(num_players=num_players, num_decks=num_decks, bet=bet,
+                          policy=POLICIES[policy_name], rng=worker_rng(seed, worker, rng_kind), penetration=penetration,
+                          shoe_type=shoe_type, rules=rules)
+    stats = None
+    if collect_stats:
+        stats = StatsCollector()
+        stats.attach(simulator.game)
+    return simulator.run(rounds), stats
+
+
+def run_parallel(rounds: int, seed: int = 0, workers: int | None = None, num_players: int = 1,
+                 num_decks: int = 6, bet: int = 10, policy_name: str = 'basic',
+                 penetration: float = 0.75, shoe_type: str = 'array',
+                 stats: StatsCollector | None = None, rng_kind: str = 'mt',
+                 rules: RuleSet | None = None) -> list[SeatStats]:
+    # one task per worker keeps the inter-process traffic to a single result each;
+    # if a StatsCollector is given every worker keeps one and they are merged into it
+    workers = workers or os.cpu_count() or 1
+    shares = split_rounds(rounds, workers)
+    totals = [SeatStats() for _ in range(num_players)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_worker, share, seed, worker, num_players, num_decks, bet, policy_name,
+                               penetration, shoe_type, stats is not None, rng_kind, rules)
+                   for worker, share in enumerate(shares)]
+        # merge in worker order so the report never depends on which process finished first
+        for future in futures:
+            seats, worker_stats = future.result()
+            for total, seat in zip(totals, seats):
+                total.merge(seat)
+            if stats is not None:
+                stats.merge(worker_stats)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel headless blackjack simulation")
+    parser.add_argument('--rounds', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--penetration', type=float, default=0.75)
+    parser.add_argument('--shoe', choices=SHOE_TYPES, default='array')
+    parser.add_argument('--bet', type=int, default=10)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='basic')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rules', type=parse_rules, default=RuleSet(), help="e.g. h17,6:5,peek,ls,hands=4")
+    parser.add_argument('--rng', choices=RNG_KINDS, default='mt', help="generator behind each worker's stream")
+    parser.add_argument('--stats', action='store_true', help="also report EV with confidence intervals per starting hand")
+    args = parser.parse_args()
+
+    stats = StatsCollector() if args.stats else None
+    start = time.perf_counter()
+    seats = run_parallel(args.rounds, args.seed, args.workers, args.players, args.decks, args.bet,
+                         args.policy, args.penetration, args.shoe, stats, args.rng, args.rules)
+    elapsed = time.perf_counter() - start
+    print(format_report(seats, args.rounds, elapsed))
+    if stats is not None:
+        print(format_stats(stats, args.bet))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import struct
+import time
+from gamelogic import BlackjackGame, LOG_BET, LOG_HIT, LOG_STAND, LOG_DOUBLE, LOG_SPLIT, LOG_SURRENDER, LOG_CHIPS, LOG_NEW_ROUND
+from rng import RNG_KINDS, make_rng
+from rules import RuleSet, parse_rules
+from simulation import Simulator, SeatStats, POLICIES, SHOE_TYPES, format_report, make_shoe
+
+# Record a session as its table setup (seed, generator, seats, shoe, rules) plus the
+# actions taken, and replay it headless. Every shuffle and draw comes from the one
+# generator make_rng(seed, kind=rng_kind) gives, so the actions alone bring back every
+# card: a log costs about 1 byte per action and 5 per bet.
+# The generator runs through the whole session, so a round can only be brought back by
+# replaying every round before it (replay's rounds argument stops there), and a log
+# replays only with the same shuffle code: CPython's random for 'mt', NumPy's bit
+# generator and shuffle for 'pcg64' and 'philox'.
+
+# file layout: magic, seed, players, decks, penetration, starting chips, shoe type index,
+# RNG kind index, length of the rules text (RuleSet.describe) that follows the header
+HEADER = struct.Struct('<6sqHIdqBBH')
+MAGIC = b'BJLOG1'
+BET_AMOUNT = struct.Struct('<I')
+CHIPS_AMOUNT = struct.Struct('<q')
+
+
+class ActionLog:
+
+    def __init__(self, seed: int, num_players: int = 1, num_decks: int = 6, penetration: float = 0.75,
+                 initial_chips: int = 1000, shoe_type: str = 'array', rules: RuleSet | None = None,
+                 rng_kind: str = 'mt'):
+        self.seed = seed
+        self.num_players = num_players
+        self.num_decks = num_decks
+        self.penetration = penetration
+        self.initial_chips = initial_chips
+        self.shoe_type = shoe_type
+        self.rules = rules if rules is not None else RuleSet()
+        self.rng_kind = rng_kind
+        self.actions = bytearray()
+
+    def record(self, code: int, amount: int | None = None) -> None:
+        # called by BlackjackGame for every action it accepts
+        self.actions.append(code)
+        if code == LOG_BET:
+            self.actions += BET_AMOUNT.pack(amount)
+        elif code == LOG_CHIPS:
+            self.actions += CHIPS_AMOUNT.pack(amount)
+
+    def new_game(self, record: bool = True) -> BlackjackGame:
+        # a headless game set up like the recorded one, logging into this log unless record is False
+        rng = make_rng(self.seed, kind=self.rng_kind)
+        return BlackjackGame(num_players=self.num_players, initial_chips=self.initial_chips, headless=True,
+                             rng=rng, shoe=make_shoe(self.shoe_type, self.num_decks, self.penetration, rng),
+                             action_log=self if record else None, rules=self.rules)
+
+    def to_bytes(self) -> bytes:
+        rules = self.rules.describe().encode()
+        header = HEADER.pack(MAGIC, self.seed, self.num_players, self.num_decks, self.penetration,
+                             self.initial_chips, SHOE_TYPES.index(self.shoe_type), RNG_KINDS.index(self.rng_kind),
+                             len(rules))
+        return header + rules + self.actions
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ActionLog':
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a blackjack action log")
+        _, seed, num_players, num_decks, penetration, initial_chips, shoe_index, rng_index, rules_size = \
+            HEADER.unpack_from(data)
+        start = HEADER.size + rules_size
+        rules = parse_rules(data[HEADER.size:start].decode())
+        log = cls(seed, num_players, num_decks, penetration, initial_chips, SHOE_TYPES[shoe_index], rules,
+                  RNG_KINDS[rng_index])
+        log.actions = bytearray(data[start:])
+        return log
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> 'ActionLog':
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def replay(log: ActionLog, rounds: int | None = None, on_round=None) -> BlackjackGame:
+    # run the logged actions through a fresh game. on_round(game) is called as each round
+    # finishes, before its hands are cleared. With rounds set, stop at the end of that
+    # round so its cards, bets and round_result can be looked at.
+    game = log.new_game(record=False)
+    actions = {LOG_HIT: game.hit, LOG_STAND: game.stand, LOG_DOUBLE: game.double_down, LOG_SPLIT: game.split,
+               LOG_SURRENDER: game.surrender}
+    data = log.actions
+    end = len(data)
+    i = 0
+    played = 0
+    while i < end:
+        code = data[i]
+        i += 1
+        action = actions.get(code)
+        if action is not None:
+            action()
+        elif code == LOG_BET:
+            game.accept_player_bet(BET_AMOUNT.unpack_from(data, i)[0])
+            i += BET_AMOUNT.size
+        elif code == LOG_CHIPS:
+            game.reset_chips(CHIPS_AMOUNT.unpack_from(data, i)[0])
+            i += CHIPS_AMOUNT.size
+        elif code == LOG_NEW_ROUND:
+            if on_round is not None:
+                on_round(game)
+            played += 1
+            if played == rounds:
+                break
+            game.new_round()
+        else:
+            raise ValueError(f"Unknown action code {code} at byte {i - 1}")
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and replay headless blackjack sessions")
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help="simulate a session and save its action log")
+    record.add_argument('path')
+    record.add_argument('--rounds', type=int, default=100000)
+    record.add_argument('--players', type=int, default=1)
+    record.add_argument('--decks', type=int, default=6)
+    record.add_argument('--penetration', type=float, default=0.75)
+    record.add_argument('--shoe', choices=SHOE_TYPES, default='array')
+    record.add_argument('--bet', type=int, default=10)
+    record.add_argument('--policy', choices=sorted(POLICIES), default='basic')
+    record.add_argument('--seed', type=int, default=0)
+    record.add_argument('--rng', choices=RNG_KINDS, default='mt', help="generator behind the shoe")
+    record.add_argument('--rules', type=parse_rules, default=RuleSet(), help="e.g. h17,6:5,peek,ls")
+    play = commands.add_parser('play', help="replay a saved action log")
+    play.add_argument('path')
+    play.add_argument('--rounds', type=int, default=None, help="stop after this many rounds")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        log = ActionLog(args.seed, args.players, args.decks, args.penetration, shoe_type=args.shoe,
+                        rules=args.rules, rng_kind=args.rng)
+        simulator = Simulator(bet=args.bet, policy=POLICIES[args.policy], game=log.new_game())
+        start = time.perf_counter()
+        seats = simulator.run(args.rounds)
+        elapsed = time.perf_counter() - start
+        log.save(args.path)
+        print(format_report(seats, args.rounds, elapsed))
+        print(f"Saved {len(log.actions):,} bytes of actions to {args.path}")
+        return
+
+    log = ActionLog.load(args.path)
+    seats = [SeatStats() for _ in range(log.num_players)]
+    played = 0
+
+    def tally(game):
+        nonlocal played
+        played += 1
+        for seat, seat_result in zip(seats, game.round_result):
+            seat.record(seat_result)
+
+    start = time.perf_counter()
+    replay(log, args.rounds, tally)
+    elapsed = time.perf_counter() - start
+    print(format_report(seats, played, elapsed))
+
+
+if __name__ == '__main__':
+    main()
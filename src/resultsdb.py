@@ -0,0 +1,256 @@
+import argparse
+import multiprocessing
+import queue
+import random
+import sqlite3
+import time
+import traceback
+from datetime import datetime
+from CardClass import CARD_RANK, CARD_SUIT
+from gamelogic import BlackjackGame, RoundListener
+from settlement import Outcome
+from rules import RuleSet, parse_rules
+from simulation import Simulator, POLICIES, SHOE_TYPES, format_report
+
+# Optional SQLite persistence of finished rounds: every round, every hand and every seat's
+# chips after the payouts, kept per session. Rows are collected in memory as rounds end
+# and every BATCH_ROUNDS rounds a writer process stores them with executemany in one
+# transaction, so the game loop only ever appends to lists.
+
+BATCH_ROUNDS = 2000
+
+# seconds between checks that the writer is still alive while waiting for room in the queue
+PUT_TIMEOUT = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    num_players INTEGER NOT NULL,
+    num_decks INTEGER NOT NULL,
+    penetration REAL NOT NULL,
+    rules TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rounds (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    round INTEGER NOT NULL,
+    upcard INTEGER NOT NULL,
+    dealer_cards TEXT NOT NULL,
+    dealer_total INTEGER NOT NULL,
+    PRIMARY KEY (session_id, round)
+);
+CREATE TABLE IF NOT EXISTS hands (
+    session_id INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    hand INTEGER NOT NULL,
+    upcard INTEGER NOT NULL,
+    cards TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    bet INTEGER NOT NULL,
+    payout INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bankrolls (
+    session_id INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    chips INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rounds_upcard ON rounds (session_id, upcard);
+CREATE INDEX IF NOT EXISTS hands_seat ON hands (session_id, seat);
+CREATE INDEX IF NOT EXISTS hands_upcard ON hands (upcard, total);
+CREATE INDEX IF NOT EXISTS bankrolls_seat ON bankrolls (session_id, seat, round);
+"""
+
+# short card names for the cards columns, e.g. "10H" or "AS"
+CARD_SHORT_NAME = [f"{rank}{suit[0]}" for suit, rank in zip(CARD_SUIT, CARD_RANK)]
+OUTCOME_NAMES = [outcome.name.lower() for outcome in Outcome]
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    # WAL lets readers query the database while a session is still writing to it
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _cards_text(codes: bytes) -> str:
+    return " ".join([CARD_SHORT_NAME[code] for code in codes])
+
+
+def _write_batches(path: str, batches, errors) -> None:
+    # the writer process: one transaction per batch until None arrives. A failure is sent
+    # back on errors before the process dies, so the game can raise it
+    try:
+        _write_all(path, batches)
+    except BaseException:
+        errors.put(traceback.format_exc())
+        raise
+
+
+def _write_all(path: str, batches) -> None:
+    connection = _connect(path)
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        rounds, hands, bankrolls = batch
+        rounds = [(session, number, upcard, _cards_text(cards), total)
+                  for session, number, upcard, cards, total in rounds]
+        hands = [(session, number, seat, i, upcard, _cards_text(cards), total, OUTCOME_NAMES[outcome], bet, paid)
+                 for session, number, seat, i, upcard, cards, total, outcome, bet, paid in hands]
+        with connection:
+            connection.executemany("INSERT INTO rounds VALUES (?, ?, ?, ?, ?)", rounds)
+            connection.executemany("INSERT INTO hands VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", hands)
+            connection.executemany("INSERT INTO bankrolls VALUES (?, ?, ?, ?)", bankrolls)
+    connection.close()
+
+
+class ResultsSink(RoundListener):
+    # Attached to a game through its action_log hook (in front of any log already there),
+    # it picks up each round when new_round is called and does nothing on other actions.
+
+    def __init__(self, path: str, batch_rounds: int = BATCH_ROUNDS):
+        super().__init__()
+        self.connection = _connect(path)
+        self.batch_rounds = batch_rounds
+        # batches are written by a separate process with its own connection, so the
+        # SQLite work doesn't compete with the game for the interpreter lock
+        self._batches = multiprocessing.Queue(maxsize=4)
+        self._errors = multiprocessing.Queue()
+        self._writer = multiprocessing.Process(target=_write_batches, args=(path, self._batches, self._errors),
+                                               daemon=True)
+        self._writer.start()
+        # what the writer sent back when it failed, once it has been read
+        self._failure = None
+        self.session_id = None
+        self.rounds = 0
+        self._rounds = []
+        self._hands = []
+        self._bankrolls = []
+
+    def attach(self, game: BlackjackGame) -> None:
+        # start a new session for this game
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO sessions (started, num_players, num_decks, penetration, rules) VALUES (?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), game.num_players, game.num_decks, game.penetration,
+                 game.rules.describe()))
+        self.session_id = cursor.lastrowid
+        self.rounds = 0
+        super().attach(game)
+
+    def add_round(self, game: BlackjackGame) -> None:
+        # queue the round the game has just settled (nothing before the first deal)
+        dealer = game.dealer.hand
+        if not dealer.cards:
+            return
+        session, number = self.session_id, self.rounds
+        # only plain numbers and card code bytes are queued (cheap to send to the writer),
+        # the writer turns them into text
+        upcard = dealer.cards[0].value
+        self._rounds.append((session, number, upcard, bytes([card.code for card in dealer.cards]), dealer.value))
+        hands = self._hands
+        for seat, (player, seat_result) in enumerate(zip(game.players, game.round_result)):
+            for i, (hand, (outcome, bet, paid)) in enumerate(zip(player.hands, seat_result.hands)):
+                hands.append((session, number, seat, i, upcard, bytes([card.code for card in hand.cards]), hand.value,
+                              outcome.value, bet, paid))
+            self._bankrolls.append((session, number, seat, seat_result.chips))
+        self.rounds += 1
+        if len(self._rounds) >= self.batch_rounds:
+            self.flush()
+
+    def flush(self) -> None:
+        # hand everything queued to the writer process as one batch
+        if not self._rounds:
+            return
+        self._put((self._rounds, self._hands, self._bankrolls))
+        self._rounds = []
+        self._hands = []
+        self._bankrolls = []
+
+    def _put(self, item) -> None:
+        # wait for room in the queue, but never on a writer that has died
+        while True:
+            self._check_writer()
+            try:
+                self._batches.put(item, timeout=PUT_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+    def _check_writer(self) -> None:
+        if self._writer.is_alive():
+            return
+        if self._failure is None:
+            try:
+                self._failure = ":\n" + self._errors.get(timeout=PUT_TIMEOUT)
+            except queue.Empty:
+                self._failure = ""
+            # nobody reads the queue any more, don't wait at exit for what is still buffered
+            self._batches.cancel_join_thread()
+        raise RuntimeError(f"The results writer stopped (exit code {self._writer.exitcode}){self._failure}")
+
+    def close(self) -> None:
+        try:
+            self.finish_round()
+            self.flush()
+            self._put(None)
+            self._writer.join()
+            if self._writer.exitcode:
+                self._check_writer()
+        finally:
+            self.connection.close()
+
+    def __enter__(self) -> 'ResultsSink':
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        try:
+            self.close()
+        except RuntimeError:
+            # a writer failure already on its way out isn't raised a second time
+            if exc_type is None:
+                raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store simulated rounds in SQLite, or query the database")
+    parser.add_argument('path')
+    parser.add_argument('--sql', default=None, help="run this query instead of simulating")
+    parser.add_argument('--rounds', type=int, default=100000)
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--penetration', type=float, default=0.75)
+    parser.add_argument('--shoe', choices=SHOE_TYPES, default='array')
+    parser.add_argument('--bet', type=int, default=10)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='basic')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--rules', type=parse_rules, default=RuleSet(), help="e.g. h17,6:5,peek,ls")
+    args = parser.parse_args()
+
+    if args.sql:
+        connection = sqlite3.connect(args.path)
+        for row in connection.execute(args.sql):
+            print(*row, sep='\t')
+        connection.close()
+        return
+
+    rng = random.Random(args.seed) if args.seed is not None else None
+    simulator = Simulator(num_players=args.players, num_decks=args.decks, bet=args.bet,
+                          policy=POLICIES[args.policy], rng=rng, penetration=args.penetration,
+                          shoe_type=args.shoe, rules=args.rules)
+    start = time.perf_counter()
+    with ResultsSink(args.path) as sink:
+        sink.attach(simulator.game)
+        seats = simulator.run(args.rounds)
+    elapsed = time.perf_counter() - start
+    print(format_report(seats, args.rounds, elapsed))
+    print(f"Session {sink.session_id} written to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import random
+import time
+from array import array
+import numpy as np
+from CardClass import Shoe
+
+# Random number streams for shoes and tables. Anything with shuffle() and random() can
+# shuffle a shoe (see CardClass.RNG); NumpyRNG gives those two on a NumPy PCG64 or Philox
+# generator, which shuffles a shoe's card array in place many times faster than
+# random.Random. Stream i of a seed comes from its own spawned SeedSequence, so tables
+# and shoes get independent streams that can be replayed one at a time.
+
+RNG_KINDS = ('mt', 'pcg64', 'philox')
+
+
+class NumpyRNG:
+
+    # random() hands out floats from a block drawn this many at a time
+    BLOCK = 4096
+
+    def __init__(self, generator: np.random.Generator):
+        self.generator = generator
+        self._block = []
+
+    def shuffle(self, items) -> None:
+        # in place, like random.shuffle; a shoe's code array is shuffled through a view of its buffer
+        if isinstance(items, array):
+            self.generator.shuffle(np.frombuffer(items, dtype=items.typecode))
+            return
+        order = self.generator.permutation(len(items))
+        items[:] = [items[i] for i in order]
+
+    def random(self) -> float:
+        block = self._block
+        if not block:
+            # reversed so pop() hands them out in the order they were drawn
+            block = self._block = self.generator.random(self.BLOCK)[::-1].tolist()
+        return block.pop()
+
+    def permutations(self, n: int, count: int) -> np.ndarray:
+        # count independent orderings of range(n) in one call, one per row
+        return self.generator.permuted(np.broadcast_to(np.arange(n), (count, n)), axis=1)
+
+
+def make_rng(seed: int | None, stream: int | None = None, kind: str = 'mt'):
+    # the generator for one stream of a seed (the seed's own stream when stream is None).
+    # 'mt' is random.Random, as every seeded run before NumPy streams were added used
+    if kind == 'mt':
+        if seed is None:
+            return random.Random()
+        return random.Random(seed if stream is None else f"{seed}/{stream}")
+    spawn_key = () if stream is None else (stream,)
+    sequence = np.random.SeedSequence(seed, spawn_key=spawn_key)
+    if kind == 'pcg64':
+        return NumpyRNG(np.random.Generator(np.random.PCG64(sequence)))
+    if kind == 'philox':
+        return NumpyRNG(np.random.Generator(np.random.Philox(sequence)))
+    raise ValueError(f"Unknown RNG kind: {kind!r}")
+
+
+def streams(seed: int | None, count: int, kind: str = 'mt') -> list:
+    # one independent generator per table (or shoe)
+    return [make_rng(seed, stream, kind) for stream in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time shoe shuffles with each kind of generator")
+    parser.add_argument('--shuffles', type=int, default=20000)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for kind in RNG_KINDS:
+        shoe = Shoe(args.decks, rng=make_rng(args.seed, kind=kind))
+        start = time.perf_counter()
+        for _ in range(args.shuffles):
+            shoe.shuffle()
+        elapsed = time.perf_counter() - start
+        print(f"{kind:>6}: {args.shuffles / elapsed:,.0f} shoe shuffles/sec")
+
+
+if __name__ == '__main__':
+    main()
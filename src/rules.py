@@ -0,0 +1,122 @@
+import math
+from functools import lru_cache
+from typing import NamedTuple
+from CardClass import HAND_TOTALS, dealer_hit_table
+from settlement import Outcome
+
+# Table rules as data. A RuleSet is compiled once (and cached) into lookup tables by hand
+# state and outcome, so the game answers "does the dealer draw", "can this hand double"
+# and "what does this outcome pay" with an index rather than a chain of rule checks.
+
+# two-card totals a hand may double on
+DOUBLE_TOTALS = {
+    'any': frozenset(range(4, 22)),
+    '9-11': frozenset((9, 10, 11)),
+    '10-11': frozenset((10, 11)),
+}
+
+# max_hands of 0 means a seat can keep splitting as long as pairs come
+NO_HAND_LIMIT = 1 << 30
+
+
+class RuleSet(NamedTuple):
+    # the defaults are the table the engine has always dealt: S17, 3:2, no peek, double
+    # any two cards (after splits too), split and resplit anything, aces included, play
+    # split aces on, no surrender
+    hit_soft_17: bool = False
+    blackjack_pays: tuple[int, int] = (3, 2)
+    dealer_peeks: bool = False
+    double_on: str = 'any'
+    double_after_split: bool = True
+    max_hands: int = 0
+    resplit_aces: bool = True
+    hit_split_aces: bool = True
+    # on the first two cards; late (after the peek) when the dealer peeks, early otherwise
+    surrender: bool = False
+
+    def describe(self) -> str:
+        # the short form parse_rules reads back, e.g. "h17,6:5,peek,double=any,das,hands=4,norsa,nohsa,ls"
+        flag = lambda on, name: name if on else f"no{name}"
+        return ",".join((
+            'h17' if self.hit_soft_17 else 's17',
+            f"{self.blackjack_pays[0]}:{self.blackjack_pays[1]}",
+            flag(self.dealer_peeks, 'peek'),
+            f"double={self.double_on}",
+            flag(self.double_after_split, 'das'),
+            f"hands={self.max_hands}",
+            flag(self.resplit_aces, 'rsa'),
+            flag(self.hit_split_aces, 'hsa'),
+            flag(self.surrender, 'ls'),
+        ))
+
+
+# short names for the on/off rules
+FLAGS = {'peek': 'dealer_peeks', 'das': 'double_after_split', 'rsa': 'resplit_aces', 'hsa': 'hit_split_aces',
+         'ls': 'surrender'}
+
+
+def parse_rules(text: str) -> RuleSet:
+    # a RuleSet from comma separated changes to the defaults, e.g. "h17,6:5,ls,hands=4"
+    changes = {}
+    for token in text.lower().replace(' ', '').split(','):
+        if not token:
+            continue
+        if token in ('h17', 's17'):
+            changes['hit_soft_17'] = token == 'h17'
+        elif token in FLAGS:
+            changes[FLAGS[token]] = True
+        elif token.startswith('no') and token[2:] in FLAGS:
+            changes[FLAGS[token[2:]]] = False
+        elif ':' in token:
+            paid, staked = token.split(':')
+            changes['blackjack_pays'] = (int(paid), int(staked))
+        elif token.startswith('double='):
+            double_on = token.split('=', 1)[1]
+            if double_on not in DOUBLE_TOTALS:
+                raise ValueError(f"Unknown double rule {double_on!r}, expected one of {', '.join(DOUBLE_TOTALS)}")
+            changes['double_on'] = double_on
+        elif token.startswith('hands='):
+            changes['max_hands'] = int(token.split('=', 1)[1])
+        else:
+            raise ValueError(f"Unknown rule {token!r}")
+    return RuleSet()._replace(**changes)
+
+
+class RuleTables(NamedTuple):
+    rules: RuleSet
+    # by hand state
+    dealer_hits: list[bool]
+    double_states: list[bool]
+    # chips back per Outcome are bet * payouts[outcome] // payout_unit
+    payouts: tuple[int, ...]
+    payout_unit: int
+    double_after_split: bool
+    max_hands: int
+    resplit_aces: bool
+    hit_split_aces: bool
+    surrender: bool
+    dealer_peeks: bool
+
+
+def _double_states(totals: frozenset) -> list[bool]:
+    # two-card hands on one of these totals
+    return [state // (2 * HAND_TOTALS) == 2 and state % HAND_TOTALS in totals for state in range(8 * HAND_TOTALS)]
+
+
+def _payouts(blackjack_pays: tuple[int, int]) -> tuple[tuple[int, ...], int]:
+    # whole numbers of 1/unit bets per outcome; unit is 2 for 3:2, so the default table is PAYOUT_HALVES
+    paid, staked = blackjack_pays
+    unit = math.lcm(2, staked)
+    back = {
+        Outcome.WIN: 2 * unit, Outcome.WIN_DEALER_BUST: 2 * unit, Outcome.BLACKJACK: unit + unit * paid // staked,
+        Outcome.PUSH: unit, Outcome.BLACKJACK_PUSH: unit, Outcome.SURRENDER: unit // 2,
+    }
+    return tuple(back.get(outcome, 0) for outcome in Outcome), unit
+
+
+@lru_cache(maxsize=None)
+def compile_rules(rules: RuleSet) -> RuleTables:
+    payouts, unit = _payouts(rules.blackjack_pays)
+    return RuleTables(rules, dealer_hit_table(rules.hit_soft_17), _double_states(DOUBLE_TOTALS[rules.double_on]),
+                      payouts, unit, rules.double_after_split, rules.max_hands or NO_HAND_LIMIT,
+                      rules.resplit_aces, rules.hit_split_aces, rules.surrender, rules.dealer_peeks)
@@ -0,0 +1,96 @@
+from enum import IntEnum
+from typing import NamedTuple
+
+# Settling a finished round: every hand gets an outcome code and a payout, and the
+# round summary text is only built from these when something wants to show it.
+
+
+class Outcome(IntEnum):
+    WIN = 0
+    WIN_DEALER_BUST = 1
+    BLACKJACK = 2
+    PUSH = 3
+    BLACKJACK_PUSH = 4
+    LOSS = 5
+    BUST = 6
+    DEALER_BLACKJACK = 7
+    SURRENDER = 8
+
+
+# chips paid back per outcome in half bets: 3:2 on a blackjack (int(bet * 2.5)), even money
+# on a win, the stake back on a push, nothing on a loss and half back on a surrender
+# (the default table, rules.compile_rules builds one for other blackjack payouts)
+PAYOUT_HALVES = (4, 4, 5, 2, 2, 0, 0, 0, 1)
+
+WINS = frozenset((Outcome.WIN, Outcome.WIN_DEALER_BUST, Outcome.BLACKJACK))
+PUSHES = frozenset((Outcome.PUSH, Outcome.BLACKJACK_PUSH))
+LOSSES = frozenset((Outcome.LOSS, Outcome.BUST, Outcome.DEALER_BLACKJACK, Outcome.SURRENDER))
+
+
+class HandResult(NamedTuple):
+    outcome: Outcome
+    bet: int
+    payout: int
+
+
+class SeatResult(NamedTuple):
+    name: str
+    # chips after the payouts
+    chips: int
+    hands: list[HandResult]
+
+
+def settle_hand(value: int, bust: bool, blackjack: bool, dealer_value: int, dealer_bust: bool,
+                dealer_blackjack: bool) -> Outcome:
+    # no peek, so a dealer blackjack beats everything but a player blackjack
+    if blackjack:
+        return Outcome.BLACKJACK_PUSH if dealer_blackjack else Outcome.BLACKJACK
+    if bust:
+        return Outcome.BUST
+    if dealer_blackjack:
+        return Outcome.DEALER_BLACKJACK
+    if dealer_bust:
+        return Outcome.WIN_DEALER_BUST
+    if value > dealer_value:
+        return Outcome.WIN
+    if value < dealer_value:
+        return Outcome.LOSS
+    return Outcome.PUSH
+
+
+def payout(outcome: Outcome, bet: int) -> int:
+    return bet * PAYOUT_HALVES[outcome] // 2
+
+
+def format_hand(label: str, result: HandResult) -> str:
+    outcome, bet, paid = result
+    if outcome == Outcome.BLACKJACK_PUSH:
+        return f"{label}: Push (Both Blackjack)"
+    if outcome == Outcome.BLACKJACK:
+        return f"{label}: Blackjack! Wins ${paid - bet}"
+    if outcome == Outcome.BUST:
+        return f"{label}: Bust! Loses ${bet}"
+    if outcome == Outcome.DEALER_BLACKJACK:
+        return f"{label}: Loses ${bet} (Dealer Blackjack)"
+    if outcome == Outcome.SURRENDER:
+        return f"{label}: Surrenders, loses ${bet - paid}"
+    if outcome == Outcome.WIN_DEALER_BUST:
+        return f"{label}: Wins ${paid - bet} (Dealer Busts)"
+    if outcome == Outcome.WIN:
+        return f"{label}: Wins ${paid - bet}"
+    if outcome == Outcome.LOSS:
+        return f"{label}: Loses ${bet}"
+    return f"{label}: Push"
+
+
+def format_round(seats: list[SeatResult]) -> str:
+    # the end of round summary shown by the GUI
+    parts = []
+    for seat in seats:
+        if not seat.hands:
+            continue
+        multiple = len(seat.hands) > 1
+        hands = [format_hand(f"{seat.name} Hand {i+1}" if multiple else seat.name, hand)
+                 for i, hand in enumerate(seat.hands)]
+        parts.append(". ".join(hands) + f". {seat.name} Chips: ${seat.chips}")
+    return "Round Over: " + " | ".join(parts) if parts else "Round Over. No bets resolved."
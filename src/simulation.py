@@ -0,0 +1,270 @@
+import argparse
+import random
+import time
+from typing import Callable
+from CardClass import CompositionShoe, Hand, RNG, Shoe
+from gamelogic import BlackjackGame, GameState
+from rules import RuleSet, parse_rules
+from settlement import Outcome, PUSHES, SeatResult, WINS
+
+# Headless simulation of BlackjackGame: plays rounds through the same rules as the GUI
+# but with no pygame, no messages and a pluggable decision policy.
+
+# action codes (same keys as the old text interface)
+HIT = 'H'
+STAND = 'S'
+DOUBLE = 'D'
+SPLIT = 'P'
+SURRENDER = 'R'
+
+# a policy looks at the hand being played and the dealer's upcard value (2-11)
+# and returns one of the action codes above
+Policy = Callable[[Hand, int, bool, bool], str]
+# asked first, when the table allows surrender: give up this hand against this upcard?
+SurrenderPolicy = Callable[[Hand, int], bool]
+# sizes every seat's bet for the next round (e.g. counting.bet_ramp), the flat bet if not given
+BetPolicy = Callable[[BlackjackGame], int]
+
+
+def stand_on_17_policy(hand: Hand, dealer_upcard: int, can_double: bool, can_split: bool) -> str:
+    # mimic the dealer, hit until 17 or more
+    return HIT if hand.value < 17 else STAND
+
+
+def basic_strategy_policy(hand: Hand, dealer_upcard: int, can_double: bool, can_split: bool) -> str:
+    # multi-deck basic strategy, stand on soft 17 and no hole card peek
+    up = dealer_upcard
+    total = hand.value
+
+    if can_split:
+        pair_value = hand.cards[0].value
+        if pair_value == 11 and up != 11:
+            return SPLIT
+        if pair_value == 9 and up not in (7, 10, 11):
+            return SPLIT
+        if pair_value == 8 and up <= 9:
+            return SPLIT
+        if pair_value in (2, 3, 7) and up <= 7:
+            return SPLIT
+        if pair_value == 6 and up <= 6:
+            return SPLIT
+        if pair_value == 4 and up in (5, 6):
+            return SPLIT
+
+    # soft hands still count an ace as 11
+    if hand.soft:
+        if total >= 19:
+            return STAND
+        if total == 18:
+            if can_double and 3 <= up <= 6:
+                return DOUBLE
+            return STAND if up <= 8 else HIT
+        if total == 17:
+            return DOUBLE if can_double and 3 <= up <= 6 else HIT
+        if total >= 15:
+            return DOUBLE if can_double and 4 <= up <= 6 else HIT
+        return DOUBLE if can_double and 5 <= up <= 6 else HIT
+
+    if total >= 17:
+        return STAND
+    if total >= 13:
+        return STAND if up <= 6 else HIT
+    if total == 12:
+        return STAND if 4 <= up <= 6 else HIT
+    if total in (10, 11):
+        return DOUBLE if can_double and up <= 9 else HIT
+    if total == 9:
+        return DOUBLE if can_double and 3 <= up <= 6 else HIT
+    return HIT
+
+
+POLICIES = {
+    'basic': basic_strategy_policy,
+    'dealer': stand_on_17_policy,
+}
+
+
+def basic_surrender_policy(hand: Hand, dealer_upcard: int) -> bool:
+    # multi-deck late surrender: hard 16 (not a pair of 8s) against 9, 10 or ace, hard 15 against 10
+    if hand.soft or hand.cards[0].value == 8 == hand.cards[1].value:
+        return False
+    return (hand.value == 16 and dealer_upcard >= 9) or (hand.value == 15 and dealer_upcard == 10)
+
+
+def never_surrender(hand: Hand, dealer_upcard: int) -> bool:
+    return False
+
+
+# shoe types: a real shuffled shoe, composition sampling (any number of decks), or an infinite deck
+SHOE_TYPES = ('array', 'composition', 'infinite')
+
+
+def make_shoe(shoe_type: str, num_decks: int, penetration: float, rng: RNG | None = None):
+    if shoe_type == 'array':
+        return Shoe(num_decks, penetration, rng)
+    if shoe_type in ('composition', 'infinite'):
+        return CompositionShoe(num_decks, penetration, rng, infinite=shoe_type == 'infinite')
+    raise ValueError(f"Unknown shoe type: {shoe_type!r}")
+
+
+class SeatStats:
+    # running totals for one seat over a simulation
+
+    FIELDS = ('hands', 'wagered', 'net', 'wins', 'losses', 'pushes', 'blackjacks', 'busts')
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def merge(self, other: 'SeatStats') -> None:
+        # add another run's totals into this one
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def record(self, seat_result: SeatResult) -> None:
+        # add one round's settled hands for this seat
+        for outcome, bet, paid in seat_result.hands:
+            self.hands += 1
+            self.wagered += bet
+            self.net += paid - bet
+            if outcome in WINS:
+                self.wins += 1
+                self.blackjacks += outcome == Outcome.BLACKJACK
+            elif outcome in PUSHES:
+                self.pushes += 1
+            else:
+                self.losses += 1
+                self.busts += outcome == Outcome.BUST
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+# chips every seat starts each round with
+BANKROLL = 100000
+
+
+class Simulator:
+
+    def __init__(self, num_players: int = 1, num_decks: int = 6, bet: int = 10,
+                 policy: Policy = basic_strategy_policy, bankroll: int = BANKROLL,
+                 game: BlackjackGame | None = None, rng: RNG | None = None,
+                 penetration: float = 0.75, shoe_type: str = 'array', rules: RuleSet | None = None,
+                 surrender_policy: SurrenderPolicy = basic_surrender_policy,
+                 bet_policy: BetPolicy | None = None):
+        # a prebuilt headless game can be passed in (e.g. one dealing from scripted shoes)
+        if game is None:
+            game = BlackjackGame(num_players=num_players, initial_chips=bankroll, headless=True, rng=rng,
+                                 shoe=make_shoe(shoe_type, num_decks, penetration, rng), rules=rules)
+        self.game = game
+        num_players = game.num_players
+        self.bet = bet
+        self.policy = policy
+        # only asked at tables that offer surrender
+        self.surrender_policy = surrender_policy
+        self.bet_policy = bet_policy
+        # every seat starts each round with the same stack so nobody can go broke mid-run
+        self.bankroll = bankroll
+        self.seats = [SeatStats() for _ in range(num_players)]
+        self.rounds = 0
+
+    def play_round(self) -> None:
+        game = self.game
+        game.reset_chips(self.bankroll)
+        bet = self.bet if self.bet_policy is None else self.bet_policy(game)
+        for _ in game.players:
+            # a refused bet leaves the round undealt
+            if not game.accept_player_bet(bet):
+                raise ValueError(f"A ${bet} bet was refused with a ${self.bankroll} bankroll: {game.message}")
+
+        policy = self.policy
+        dealer_upcard = game.dealer.hand.cards[0].value
+        # what the table rules allow is looked up by the game; the checks that can never
+        # fail under these rules are skipped
+        offers_surrender = game.rule_tables.surrender
+        locks_split_aces = not game.rule_tables.hit_split_aces
+        while game.state == GameState.PLAYER_TURN:
+            hand = game.players[game.current_player_index].current_hand
+            if offers_surrender and game.can_surrender() and self.surrender_policy(hand, dealer_upcard):
+                game.surrender()
+                continue
+            # only two-card hands (and only pairs for splits) are worth asking about
+            cards = hand.cards
+            two_cards = len(cards) == 2
+            can_double = two_cards and game.can_double()
+            can_split = two_cards and cards[0].value == cards[1].value and game.can_split()
+
+            action = policy(hand, dealer_upcard, can_double, can_split)
+            if action == SPLIT and not can_split:
+                action = policy(hand, dealer_upcard, can_double, False)
+            if action == DOUBLE and not can_double:
+                action = HIT
+            if action == HIT and locks_split_aces and not game.can_hit():
+                action = STAND
+
+            if action == HIT:
+                game.hit()
+            elif action == STAND:
+                game.stand()
+            elif action == DOUBLE:
+                game.double_down()
+            elif action == SPLIT:
+                game.split()
+            else:
+                raise ValueError(f"Unknown action from policy: {action!r}")
+
+        self._record_round()
+        self.rounds += 1
+        game.new_round()
+
+    def _record_round(self) -> None:
+        # tally what end_round just paid out, hand by hand
+        for seat_result, seat in zip(self.game.round_result, self.seats):
+            seat.record(seat_result)
+
+    def run(self, rounds: int) -> list[SeatStats]:
+        for _ in range(rounds):
+            self.play_round()
+        return self.seats
+
+
+def format_report(seats: list[SeatStats], rounds: int, elapsed: float) -> str:
+    lines = [f"{rounds} rounds in {elapsed:.2f}s ({rounds / elapsed if elapsed > 0 else 0:,.0f} rounds/sec)"]
+    for i, seat in enumerate(seats):
+        edge = seat.net / seat.wagered * 100 if seat.wagered else 0.0
+        lines.append(
+            f"Seat {i+1}: net ${seat.net} on ${seat.wagered} wagered ({edge:+.3f}%), "
+            f"{seat.wins} W / {seat.losses} L / {seat.pushes} P, "
+            f"{seat.blackjacks} blackjacks, {seat.busts} busts"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless blackjack simulation")
+    parser.add_argument('--rounds', type=int, default=100000)
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--penetration', type=float, default=0.75)
+    parser.add_argument('--shoe', choices=SHOE_TYPES, default='array')
+    parser.add_argument('--bet', type=int, default=10)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='basic')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--rules', type=parse_rules, default=RuleSet(),
+                        help="changes to the default rules, e.g. h17,6:5,peek,ls,nodas,hands=4,double=10-11")
+    args = parser.parse_args()
+    if not 0 < args.bet <= BANKROLL:
+        parser.error(f"--bet must be between 1 and the ${BANKROLL} bankroll")
+
+    rng = random.Random(args.seed) if args.seed is not None else None
+    simulator = Simulator(num_players=args.players, num_decks=args.decks, bet=args.bet,
+                          policy=POLICIES[args.policy], rng=rng, penetration=args.penetration,
+                          shoe_type=args.shoe, rules=args.rules)
+    start = time.perf_counter()
+    seats = simulator.run(args.rounds)
+    elapsed = time.perf_counter() - start
+    print(format_report(seats, args.rounds, elapsed))
+
+
+if __name__ == '__main__':
+    main()
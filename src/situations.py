@@ -0,0 +1,213 @@
+import argparse
+import os
+import time
+import numpy as np
+from history import (read_history, read_header, MAX_ACTIONS, SOFT_FLAG, PAIR_FLAG, TOTAL_MASK, ACTION_LETTERS,
+                     ACTION_WIDTH, ACTION_MASK)
+from CardClass import CARD_VALUE
+
+# Inverted index over round history files, keyed by decision situation: the hand's total,
+# soft and pair flags, the dealer's upcard, the true count bucket the round started in,
+# the action taken and the number of decks. Every decision is a posting (file, record,
+# seat, action number) and postings are stored sorted by key, so a query is a lookup in
+# the table of distinct keys followed by slices, with no scan of the history.
+
+# true counts are rounded and clipped to -COUNT_LIMIT..COUNT_LIMIT
+COUNT_LIMIT = 8
+
+# key layout, lowest bits first
+KEY_FIELDS = (('total', 5), ('soft', 1), ('pair', 1), ('upcard', 4), ('count', 5), ('action', 3), ('decks', 12))
+
+POSTING = np.dtype([('file', '<u2'), ('record', '<u8'), ('seat', '<u2'), ('step', 'u1')])
+
+
+def _shifts() -> dict[str, tuple[int, int]]:
+    shifts = {}
+    shift = 0
+    for field, bits in KEY_FIELDS:
+        shifts[field] = (shift, (1 << bits) - 1)
+        shift += bits
+    return shifts
+
+
+SHIFTS = _shifts()
+
+
+def encode_keys(**fields) -> np.ndarray:
+    # fields as arrays (or numbers) to keys; count is the clipped true count
+    key = np.zeros(np.broadcast(*fields.values()).shape, dtype=np.int64)
+    for field, value in fields.items():
+        shift, mask = SHIFTS[field]
+        if field == 'count':
+            value = np.asarray(value) + COUNT_LIMIT
+        key |= (np.asarray(value, dtype=np.int64) & mask) << shift
+    return key
+
+
+def decode_keys(keys: np.ndarray, field: str) -> np.ndarray:
+    shift, mask = SHIFTS[field]
+    value = (keys >> shift) & mask
+    return value - COUNT_LIMIT if field == 'count' else value
+
+
+def count_bucket(true_count: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(true_count), -COUNT_LIMIT, COUNT_LIMIT).astype(np.int64)
+
+
+def source_stamps(paths: list[str]) -> np.ndarray:
+    # (size, modification time in ns) of every history file, to tell when an index is out of date
+    stamps = np.zeros((len(paths), 2), dtype=np.int64)
+    for i, path in enumerate(paths):
+        info = os.stat(path)
+        stamps[i] = info.st_size, info.st_mtime_ns
+    return stamps
+
+
+def _decisions(records: np.ndarray, decks: int, file: int) -> tuple[np.ndarray, np.ndarray]:
+    # every decision in one history file as (keys, postings)
+    seats = records['seats']
+    num_records, num_seats = seats.shape
+    taken = np.arange(MAX_ACTIONS) < seats['num_actions'][..., np.newaxis]
+    record, seat, step = np.nonzero(taken)
+    situation = seats['situations'][record, seat, step].astype(np.int64)
+    action = (seats['actions'][record, seat].astype(np.int64) >> (ACTION_WIDTH * step)) & ACTION_MASK
+    # the upcard is the dealer's first card, the low 6 bits of the packed cards
+    upcard = np.asarray(CARD_VALUE, dtype=np.int64)[records['dealer_cards'][:, 0] & 63][record]
+    keys = encode_keys(total=situation & TOTAL_MASK, soft=(situation & SOFT_FLAG) > 0,
+                       pair=(situation & PAIR_FLAG) > 0, upcard=upcard,
+                       count=count_bucket(records['true_count'])[record], action=action, decks=decks)
+    postings = np.empty(len(keys), dtype=POSTING)
+    postings['file'] = file
+    postings['record'] = record
+    postings['seat'] = seat
+    postings['step'] = step
+    return keys, postings
+
+
+class SituationIndex:
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, postings: np.ndarray, paths: list[str],
+                 stamps: np.ndarray):
+        # keys are the distinct situations in order, postings[offsets[i]:offsets[i+1]] belong to keys[i];
+        # stamps are the source_stamps of the paths when the index was built
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        self.paths = paths
+        self.stamps = stamps
+
+    @classmethod
+    def build(cls, paths: list[str]) -> 'SituationIndex':
+        # one pass over each history file
+        stamps = source_stamps(paths)
+        all_keys = []
+        all_postings = []
+        for file, path in enumerate(paths):
+            keys, postings = _decisions(read_history(path), read_header(path).num_decks, file)
+            all_keys.append(keys)
+            all_postings.append(postings)
+        keys = np.concatenate(all_keys) if all_keys else np.zeros(0, dtype=np.int64)
+        postings = np.concatenate(all_postings) if all_postings else np.zeros(0, dtype=POSTING)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        distinct, starts = np.unique(keys, return_index=True)
+        offsets = np.append(starts, len(keys)).astype(np.int64)
+        return cls(distinct, offsets, postings[order], list(paths), stamps)
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            np.savez(f, keys=self.keys, offsets=self.offsets, postings=self.postings, paths=np.array(self.paths),
+                     stamps=self.stamps)
+
+    @classmethod
+    def load(cls, path: str) -> 'SituationIndex':
+        data = np.load(path)
+        return cls(data['keys'], data['offsets'], data['postings'], data['paths'].tolist(), data['stamps'])
+
+    def is_current(self, paths: list[str]) -> bool:
+        # built from exactly these files, none of which has changed since
+        if self.paths != list(paths):
+            return False
+        try:
+            return bool(np.array_equal(self.stamps, source_stamps(paths)))
+        except FileNotFoundError:
+            return False
+
+    def _matching(self, fields: dict) -> np.ndarray:
+        # positions in self.keys of every situation that agrees with the given fields
+        if all(field in fields for field, _ in KEY_FIELDS):
+            key = encode_keys(**fields)
+            i = np.searchsorted(self.keys, key)
+            return np.array([i] if i < len(self.keys) and self.keys[i] == key else [], dtype=np.int64)
+        match = np.ones(len(self.keys), dtype=bool)
+        for field, value in fields.items():
+            match &= decode_keys(self.keys, field) == value
+        return np.nonzero(match)[0]
+
+    def find(self, total: int | None = None, soft: bool | None = None, pair: bool | None = None,
+             upcard: int | None = None, count: int | None = None, action: str | None = None,
+             decks: int | None = None) -> np.ndarray:
+        # postings for every decision matching the fields given (None matches anything);
+        # action is a letter (H, S, D, P, R) and count a true count bucket
+        fields = {'total': total, 'soft': soft, 'pair': pair, 'upcard': upcard, 'count': count,
+                  'action': None if action is None else ACTION_LETTERS.index(action), 'decks': decks}
+        fields = {field: int(value) for field, value in fields.items() if value is not None}
+        matches = self._matching(fields)
+        if not len(matches):
+            return np.zeros(0, dtype=POSTING)
+        return np.concatenate([self.postings[self.offsets[i]:self.offsets[i + 1]] for i in matches])
+
+    def breakdown(self, **fields) -> dict[str, int]:
+        # how many decisions matching the fields were each action, from the offsets alone
+        counts = {}
+        for letter in ACTION_LETTERS:
+            matches = self._matching({**{f: int(v) for f, v in fields.items() if v is not None},
+                                      'action': ACTION_LETTERS.index(letter)})
+            counts[letter] = int(sum(self.offsets[i + 1] - self.offsets[i] for i in matches))
+        return counts
+
+    def rounds(self, postings: np.ndarray, file: int = 0) -> np.ndarray:
+        # the history records behind postings from one file
+        records = read_history(self.paths[file])
+        return records[postings['record'][postings['file'] == file]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query round histories by decision situation")
+    parser.add_argument('histories', nargs='+')
+    parser.add_argument('--index', default=None, help="load the index from here, or build and save it here")
+    parser.add_argument('--total', type=int)
+    parser.add_argument('--soft', type=int, choices=(0, 1))
+    parser.add_argument('--pair', type=int, choices=(0, 1))
+    parser.add_argument('--upcard', type=int, help="2-11, 11 is an ace")
+    parser.add_argument('--count', type=int, help="true count bucket")
+    parser.add_argument('--action', choices=list(ACTION_LETTERS))
+    parser.add_argument('--decks', type=int)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = None
+    if args.index and os.path.exists(args.index):
+        index = SituationIndex.load(args.index)
+        if not index.is_current(args.histories):
+            print(f"{args.index} was built from other or older history files, rebuilding it")
+            index = None
+    if index is None:
+        index = SituationIndex.build(args.histories)
+        if args.index:
+            index.save(args.index)
+    elapsed = time.perf_counter() - start
+    print(f"Index of {len(index.postings):,} decisions in {len(index.keys):,} situations ready in {elapsed:.2f}s")
+
+    fields = dict(total=args.total, soft=args.soft, pair=args.pair, upcard=args.upcard, count=args.count,
+                  decks=args.decks)
+    start = time.perf_counter()
+    postings = index.find(action=args.action, **fields)
+    breakdown = index.breakdown(**fields)
+    elapsed = time.perf_counter() - start
+    print(f"{len(postings):,} matching decisions in {elapsed * 1000:.1f}ms; by action: "
+          + ", ".join(f"{letter} {count:,}" for letter, count in breakdown.items()))
+
+
+if __name__ == '__main__':
+    main()
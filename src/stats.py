@@ -0,0 +1,161 @@
+import math
+from gamelogic import BlackjackGame, RoundListener, LOG_HIT, LOG_STAND, LOG_DOUBLE, LOG_SPLIT, LOG_SURRENDER
+
+# Streaming statistics: running mean and variance (Welford's method) plus min and max, in
+# constant memory however many rounds go in. Collectors from separate worker processes
+# merge exactly (Chan et al.'s pairwise update), so a parallel run reports the same
+# numbers as one long run.
+
+# z for a 95% confidence interval
+Z_95 = 1.959964
+
+ACTION_LETTERS = {LOG_HIT: 'H', LOG_STAND: 'S', LOG_DOUBLE: 'D', LOG_SPLIT: 'P', LOG_SURRENDER: 'R'}
+
+
+class RunningStats:
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # sum of squared differences from the mean
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def merge(self, other: 'RunningStats') -> None:
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        # sample variance
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def stderr(self) -> float:
+        return self.stdev / math.sqrt(self.count) if self.count else 0.0
+
+    def interval(self, z: float = Z_95) -> tuple[float, float]:
+        # confidence interval for the mean
+        half = z * self.stderr
+        return self.mean - half, self.mean + half
+
+
+def _starting_total(hand, code: int) -> tuple[int, bool]:
+    # (total, soft) of the two cards the seat was dealt; a split is logged once the pair
+    # is apart, so the pair is rebuilt from the card left in the hand
+    if code == LOG_SPLIT:
+        value = hand.cards[0].value
+        return (12, True) if value == 11 else (2 * value, False)
+    return hand.value, hand.soft
+
+
+class StatsCollector(RoundListener):
+    # Per-round net chips for each seat, kept three ways: by seat, by starting hand
+    # (total, soft, dealer upcard) and by starting hand and first action taken. Blackjacks
+    # are never played, their action is '-'; hands the dealer's peek ended before anyone
+    # acted are 'peeked'. Attached to a game through its action_log hook.
+
+    def __init__(self):
+        super().__init__()
+        self.seats = {}
+        self.hands = {}
+        self.actions = {}
+        self._starts = []
+
+    def attach(self, game: BlackjackGame) -> None:
+        super().attach(game)
+        self._starts = [None] * game.num_players
+
+    def on_action(self, code: int, amount: int | None) -> None:
+        # keep each seat's first decision
+        if code in ACTION_LETTERS:
+            seat = self.game.current_player_index
+            if self._starts[seat] is None:
+                total, soft = _starting_total(self.game.players[seat].current_hand, code)
+                self._starts[seat] = (total, soft, ACTION_LETTERS[code])
+
+    def add_round(self, game: BlackjackGame) -> None:
+        # nothing to add before the first deal
+        if not game.dealer.hand.cards:
+            return
+        upcard = game.dealer.hand.cards[0].value
+        starts = self._starts
+        for seat, seat_result in enumerate(game.round_result):
+            net = 0
+            for _, bet, paid in seat_result.hands:
+                net += paid - bet
+            start = starts[seat]
+            if start is None:
+                # nothing was decided: a blackjack, or a hand the dealer's blackjack ended at the peek
+                hand = game.players[seat].hands[0]
+                start = (hand.value, hand.soft, '-' if hand.blackjack else 'peeked')
+            starts[seat] = None
+            total, soft, action = start
+            self._add(self.seats, seat, net)
+            self._add(self.hands, (total, soft, upcard), net)
+            self._add(self.actions, (total, soft, upcard, action), net)
+
+    @staticmethod
+    def _add(table: dict, key, x: float) -> None:
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = RunningStats()
+        stats.add(x)
+
+    def merge(self, other: 'StatsCollector') -> None:
+        # fold in another collector's totals (e.g. from another worker)
+        for mine, theirs in ((self.seats, other.seats), (self.hands, other.hands), (self.actions, other.actions)):
+            for key, stats in theirs.items():
+                if key not in mine:
+                    mine[key] = RunningStats()
+                mine[key].merge(stats)
+
+    def __getstate__(self):
+        # only the statistics travel between processes, not the game
+        return self.seats, self.hands, self.actions
+
+    def __setstate__(self, state) -> None:
+        self.seats, self.hands, self.actions = state
+        self.game = None
+        self._forward = None
+        self._starts = []
+
+
+def format_stats(collector: StatsCollector, bet: int, top: int = 10) -> str:
+    # per-seat edge with a 95% interval, then the starting hands seen most often
+    lines = []
+    for seat, stats in sorted(collector.seats.items()):
+        low, high = stats.interval()
+        lines.append(f"Seat {seat + 1}: {stats.count} rounds, EV {stats.mean / bet * 100:+.3f}% "
+                     f"(95% CI {low / bet * 100:+.3f}% to {high / bet * 100:+.3f}%), "
+                     f"sd {stats.stdev / bet:.3f} bets, min {stats.min}, max {stats.max}")
+    common = sorted(collector.actions.items(), key=lambda item: -item[1].count)[:top]
+    for (total, soft, upcard, action), stats in common:
+        hand = f"{'soft' if soft else 'hard'} {total}"
+        lines.append(f"  {hand:>7} vs {upcard:>2} {action}: {stats.count:>8} rounds, "
+                     f"EV {stats.mean / bet:+.4f} +/- {Z_95 * stats.stderr / bet:.4f} bets")
+    return "\n".join(lines)
@@ -0,0 +1,262 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+import guiconstants as c
+from CardClass import RANK_CLASS_CODES, RANK_CLASS_LABELS
+from dealerprob import add_value, dealer_distribution, BUST, BLACKJACK
+from rules import DOUBLE_TOTALS, RuleSet, parse_rules
+from simulation import HIT, STAND, DOUBLE, SPLIT, SURRENDER
+
+# Composition-dependent strategy solver. Works out the expected value (in units of the
+# original bet) of standing, hitting, doubling, splitting and surrendering every two-card
+# hand against every dealer upcard, for a RuleSet BlackjackGame can play:
+#   - the dealer never peeks, so a dealer blackjack takes every other hand including the
+#     extra money from doubles and splits, and surrender is early (always half the bet).
+#     Peek tables change what every decision is conditioned on and are refused
+#   - the dealer hits or stands on soft 17, blackjacks pay the table's ratio, doubles go
+#     by double_on and double_after_split, and split aces may be locked to one card
+#   - equal values split (10-K too), and a split hand with 21 on two cards is a blackjack
+# Resplits aren't modelled (split hands play on with hit/stand/double, so max_hands only
+# matters as 1, no splits), and both split hands are valued from the same composition,
+# the usual approximations.
+#
+# Dealer odds and the EV of every (upcard, composition, hand) state visited are kept in
+# memory and pickled per starting composition and rules, so solving the same table again
+# comes back in seconds. Any other deck count or composition is a fresh solve: its states
+# never coincide with another table's. The cache key includes a hash of the solver's
+# source, so a changed solver never reads results pickled by an older one.
+
+DEFAULT_CACHE_DIR = os.path.join(c.BASE_DIR, '.cache', 'strategy')
+
+# the modules whose code decides the EVs
+SOLVER_MODULES = ('dealerprob', 'strategy')
+
+# card values as they appear in tables (11 is an ace)
+VALUES = list(range(2, 12))
+
+
+def full_counts(num_decks: int) -> tuple[int, ...]:
+    # Shoe.full_counts for a fresh shoe
+    return tuple(len(codes) * num_decks for codes in RANK_CLASS_CODES)
+
+
+def _remove(counts: tuple[int, ...], value: int) -> tuple[int, ...]:
+    i = value - 2
+    return counts[:i] + (counts[i] - 1,) + counts[i + 1:]
+
+
+def solver_version() -> str:
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in SOLVER_MODULES:
+        with open(os.path.join(here, f"{name}.py"), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cache_key(counts: tuple[int, ...], rules: RuleSet) -> str:
+    text = json.dumps({'counts': counts, 'rules': rules.describe(), 'code': solver_version()}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class StrategySolver:
+
+    def __init__(self, num_decks: int = 6, counts: tuple[int, ...] | None = None,
+                 cache_dir: str | None = DEFAULT_CACHE_DIR, rules: RuleSet = RuleSet()):
+        if rules.dealer_peeks:
+            raise ValueError("The strategy solver only models tables where the dealer doesn't peek")
+        # counts are rank-class counts (Shoe.counts order) before the hand is dealt
+        self.counts = tuple(counts) if counts is not None else full_counts(num_decks)
+        self.rules = rules
+        self._blackjack_pays = rules.blackjack_pays[0] / rules.blackjack_pays[1]
+        self._double_totals = DOUBLE_TOTALS[rules.double_on]
+        self._dealer = {}
+        self._best = {}
+        self._path = None
+        if cache_dir:
+            self._path = os.path.join(cache_dir, f"ev-{cache_key(self.counts, rules)}.pkl")
+            self._load()
+
+    def _load(self) -> None:
+        if self._path and os.path.exists(self._path):
+            with open(self._path, 'rb') as f:
+                self._dealer, self._best = pickle.load(f)
+
+    def save(self) -> None:
+        # write everything worked out so far next to earlier results for this composition
+        if not self._path:
+            return
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump((self._dealer, self._best), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self._path)
+
+    def dealer_odds(self, upcard: int, counts: tuple[int, ...]) -> tuple[float, ...]:
+        key = (upcard, counts)
+        odds = self._dealer.get(key)
+        if odds is None:
+            odds = self._dealer[key] = dealer_distribution(upcard, counts, hit_soft_17=self.rules.hit_soft_17)
+        return odds
+
+    def stand_ev(self, total: int, upcard: int, counts: tuple[int, ...], blackjack: bool = False) -> float:
+        odds = self.dealer_odds(upcard, counts)
+        if blackjack:
+            # paid at the table's ratio, or a push against a dealer blackjack
+            return self._blackjack_pays * (1.0 - odds[BLACKJACK])
+        if total > 21:
+            return -1.0
+        ev = odds[BUST] - odds[BLACKJACK]
+        for i, p in enumerate(odds[:5]):
+            if total > 17 + i:
+                ev += p
+            elif total < 17 + i:
+                ev -= p
+        return ev
+
+    def _best_ev(self, total: int, soft: bool, upcard: int, counts: tuple[int, ...]) -> float:
+        # a hand that can only hit or stand, played the best way from here
+        key = (upcard, counts, total, soft)
+        ev = self._best.get(key)
+        if ev is None:
+            ev = self.stand_ev(total, upcard, counts)
+            if total < 21:
+                ev = max(ev, self.hit_ev(total, soft, upcard, counts))
+            self._best[key] = ev
+        return ev
+
+    def hit_ev(self, total: int, soft: bool, upcard: int, counts: tuple[int, ...]) -> float:
+        # take one card and play on the best way
+        left = sum(counts)
+        ev = 0.0
+        for value, count in zip(VALUES, counts):
+            if count:
+                new_total, new_soft = add_value(total, soft, value)
+                outcome = -1.0 if new_total > 21 else self._best_ev(new_total, new_soft, upcard, _remove(counts, value))
+                ev += count / left * outcome
+        return ev
+
+    def double_ev(self, total: int, soft: bool, upcard: int, counts: tuple[int, ...]) -> float:
+        # twice the bet on exactly one more card
+        left = sum(counts)
+        ev = 0.0
+        for value, count in zip(VALUES, counts):
+            if count:
+                new_total, _ = add_value(total, soft, value)
+                ev += count / left * 2.0 * self.stand_ev(new_total, upcard, _remove(counts, value))
+        return ev
+
+    def split_ev(self, value: int, upcard: int, counts: tuple[int, ...]) -> float:
+        # two hands, each starting from one of the pair and drawing its second card;
+        # counts already have both cards of the pair and the upcard taken out
+        left = sum(counts)
+        one_hand = 0.0
+        for drawn, count in zip(VALUES, counts):
+            if count:
+                evs = self._two_card_evs(value, drawn, upcard, _remove(counts, drawn), split=True)
+                one_hand += count / left * max(evs.values())
+        return 2.0 * one_hand
+
+    def _two_card_evs(self, first: int, second: int, upcard: int, counts: tuple[int, ...],
+                      split: bool = False) -> dict[str, float]:
+        total, soft = add_value(*add_value(0, False, first), second)
+        if total == 21:
+            return {STAND: self.stand_ev(total, upcard, counts, blackjack=True)}
+        evs = {STAND: self.stand_ev(total, upcard, counts)}
+        if split and first == 11 and not self.rules.hit_split_aces:
+            # split aces get their one card and stand
+            return evs
+        evs[HIT] = self.hit_ev(total, soft, upcard, counts)
+        if total in self._double_totals and (not split or self.rules.double_after_split):
+            evs[DOUBLE] = self.double_ev(total, soft, upcard, counts)
+        return evs
+
+    def hand_evs(self, first: int, second: int, upcard: int) -> dict[str, float]:
+        # EV of every action for a starting hand (card values, 11 = ace) against the upcard
+        counts = _remove(_remove(_remove(self.counts, first), second), upcard)
+        evs = self._two_card_evs(first, second, upcard, counts)
+        if first == second and self.rules.max_hands != 1:
+            evs[SPLIT] = self.split_ev(first, upcard, counts)
+        if self.rules.surrender and first + second != 21:
+            evs[SURRENDER] = -0.5
+        return evs
+
+    def solve(self) -> dict[tuple[int, int, int], dict[str, float]]:
+        # every starting hand against every upcard, saved to the cache when done
+        table = {}
+        for upcard in VALUES:
+            for first in VALUES:
+                for second in VALUES[first - 2:]:
+                    table[first, second, upcard] = self.hand_evs(first, second, upcard)
+        self.save()
+        return table
+
+    def policy(self):
+        # a simulation policy that plays the solved table for two-card hands and
+        # compares stand and hit for the hand's exact composition after that
+        table = self.solve()
+
+        def play(hand, dealer_upcard, can_double, can_split):
+            values = sorted(card.value for card in hand.cards)
+            if len(values) == 2:
+                evs = table[values[0], values[1], dealer_upcard]
+                # surrender is offered before the policy is asked (see surrender_policy)
+                allowed = {action: ev for action, ev in evs.items() if action != SURRENDER
+                           and (action != DOUBLE or can_double) and (action != SPLIT or can_split)}
+                return max(allowed, key=allowed.get)
+            counts = _remove(self.counts, dealer_upcard)
+            for value in values:
+                counts = _remove(counts, value)
+            stand = self.stand_ev(hand.value, dealer_upcard, counts)
+            return STAND if hand.value >= 21 or stand >= self.hit_ev(hand.value, hand.soft, dealer_upcard, counts) else HIT
+
+        return play
+
+    def surrender_policy(self):
+        # a Simulator surrender_policy: give up the hands the solved table surrenders
+        table = self.solve()
+
+        def surrender(hand, dealer_upcard) -> bool:
+            values = sorted(card.value for card in hand.cards)
+            evs = table[values[0], values[1], dealer_upcard]
+            return max(evs, key=evs.get) == SURRENDER
+
+        return surrender
+
+
+def format_table(table: dict[tuple[int, int, int], dict[str, float]]) -> str:
+    # best action for every starting hand, pairs first, then soft hands, then hard
+    labels = dict(zip(VALUES, RANK_CLASS_LABELS))
+    pairs = [(v, v) for v in reversed(VALUES)]
+    soft = [(v, 11) for v in reversed(VALUES[:-1])]
+    hard = sorted(((a, b) for a in VALUES[:-1] for b in VALUES[:-1] if a < b), key=lambda h: (-sum(h), h))
+    lines = ["Hand   " + " ".join(f"{labels[up]:>3}" for up in VALUES)]
+    for first, second in pairs + soft + hard:
+        row = [max(table[first, second, up], key=table[first, second, up].get) for up in VALUES]
+        lines.append(f"{labels[first]:>2},{labels[second]:<3} " + " ".join(f"{action:>3}" for action in row))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Composition-dependent blackjack strategy table")
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--rules', type=parse_rules, default=RuleSet(),
+                        help="changes to the default rules, e.g. h17,6:5,ls,nodas (peek isn't supported)")
+    parser.add_argument('--no-cache', action='store_true', help="don't read or write the EV cache")
+    args = parser.parse_args()
+    if args.rules.dealer_peeks:
+        parser.error("the solver only models tables where the dealer doesn't peek")
+
+    start = time.perf_counter()
+    solver = StrategySolver(args.decks, cache_dir=None if args.no_cache else DEFAULT_CACHE_DIR, rules=args.rules)
+    table = solver.solve()
+    elapsed = time.perf_counter() - start
+    print(format_table(table))
+    print(f"Solved {len(table)} hands for {args.decks} decks ({args.rules.describe()}) in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+from counting import CountTracker, bet_ramp
+from rules import parse_rules
+from simulation import Simulator, SeatStats, POLICIES, SHOE_TYPES
+from stats import RunningStats, StatsCollector, Z_95
+
+# Runs a grid of table configurations, one simulation per cell on a process pool, and
+# keeps every finished cell in a cache directory as <key>.json. The key is a hash of the
+# cell and of the engine source, so an overlapping grid only computes the cells it hasn't
+# seen and any change to the engine starts a fresh set of results.
+
+# the modules whose code decides a cell's results
+ENGINE_MODULES = ('CardClass', 'gamelogic', 'rules', 'settlement', 'simulation', 'counting', 'stats', 'sweep')
+
+
+class SweepCell(NamedTuple):
+    decks: int
+    # RuleSet.describe() text, so equivalent rule strings share a cell
+    rules: str
+    penetration: float
+    policy: str
+    # most bet units on the Hi-Lo ramp (1 is flat betting)
+    spread: int
+    players: int
+    rounds: int
+    seed: int
+    shoe: str = 'array'
+    bet: int = 10
+
+
+def code_version() -> str:
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ENGINE_MODULES:
+        with open(os.path.join(here, f"{name}.py"), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cell_key(cell: SweepCell, version: str) -> str:
+    text = json.dumps({'cell': cell._asdict(), 'code': version}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def make_grid(decks, rules, penetrations, policies, spreads, players, rounds: int, seed: int,
+              shoe: str = 'array', bet: int = 10) -> list[SweepCell]:
+    # every combination of the values given
+    rules = [parse_rules(text).describe() for text in rules]
+    return [SweepCell(*values, rounds, seed, shoe, bet)
+            for values in itertools.product(decks, rules, penetrations, policies, spreads, players)]
+
+
+class ResultCache:
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key: str) -> dict | None:
+        try:
+            with open(self._file(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, result: dict) -> None:
+        # written beside the final name and renamed, so a half written file is never read
+        temp = self._file(key) + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(result, f)
+        os.replace(temp, self._file(key))
+
+
+def run_cell(cell: SweepCell) -> dict:
+    # one simulation; cells with the same seed start from the same shuffles, so they differ by their settings
+    simulator = Simulator(num_players=cell.players, num_decks=cell.decks, bet=cell.bet,
+                          policy=POLICIES[cell.policy], rng=random.Random(cell.seed), penetration=cell.penetration,
+                          shoe_type=cell.shoe, rules=parse_rules(cell.rules))
+    if cell.spread > 1:
+        tracker = CountTracker(('hi-lo',))
+        tracker.attach(simulator.game.deck)
+        simulator.bet_policy = bet_ramp(tracker, cell.bet, cell.spread)
+    stats = StatsCollector()
+    stats.attach(simulator.game)
+    start = time.perf_counter()
+    seats = simulator.run(cell.rounds)
+    elapsed = time.perf_counter() - start
+    per_round = [stats.seats[seat] for seat in sorted(stats.seats)]
+    return {
+        'cell': cell._asdict(),
+        'elapsed': elapsed,
+        'seats': [{field: getattr(seat, field) for field in SeatStats.FIELDS} for seat in seats],
+        # net chips per round for each seat, as RunningStats fields
+        'per_round': [{slot: getattr(s, slot) for slot in RunningStats.__slots__} for s in per_round],
+    }
+
+
+def run_sweep(cells: list[SweepCell], cache: ResultCache, workers: int | None = None) -> tuple[list[dict], int]:
+    # results in grid order and how many cells had to be computed
+    version = code_version()
+    keys = [cell_key(cell, version) for cell in cells]
+    results = {key: cache.get(key) for key in keys}
+    missing = {key: cell for key, cell in zip(keys, cells) if results[key] is None}
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_cell, cell): key for key, cell in missing.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                results[key] = future.result()
+                # stored as each cell finishes, so an interrupted sweep keeps what it got
+                cache.put(key, results[key])
+    return [results[key] for key in keys], len(missing)
+
+
+def format_sweep(results: list[dict]) -> str:
+    lines = [f"{'decks':>5} {'rules':<58} {'pen':>5} {'policy':<7} {'spread':>6} {'seats':>5} "
+             f"{'edge':>8} {'EV/round (units, 95% CI)':>26}"]
+    for result in results:
+        cell = SweepCell(**result['cell'])
+        net = sum(seat['net'] for seat in result['seats'])
+        wagered = sum(seat['wagered'] for seat in result['seats'])
+        # the seats pooled; they share the dealer, so with several seats the interval is a little narrow
+        pooled = RunningStats()
+        for fields in result['per_round']:
+            seat = RunningStats()
+            for slot, value in fields.items():
+                setattr(seat, slot, value)
+            pooled.merge(seat)
+        half = Z_95 * pooled.stderr / cell.bet
+        lines.append(f"{cell.decks:>5} {cell.rules:<58} {cell.penetration:>5.2f} {cell.policy:<7} {cell.spread:>6} "
+                     f"{cell.players:>5} {net / wagered * 100 if wagered else 0.0:>+7.3f}% "
+                     f"{pooled.mean / cell.bet:>+15.4f} +/- {half:.4f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate every combination of the settings given, reusing cached cells")
+    parser.add_argument('--decks', type=int, nargs='+', default=[6])
+    parser.add_argument('--rules', nargs='+', default=[''], help="rule strings, e.g. '' h17 6:5,peek")
+    parser.add_argument('--penetration', type=float, nargs='+', default=[0.75])
+    parser.add_argument('--policy', nargs='+', choices=sorted(POLICIES), default=['basic'])
+    parser.add_argument('--spread', type=int, nargs='+', default=[1], help="Hi-Lo bet spread in units, 1 for flat")
+    parser.add_argument('--players', type=int, nargs='+', default=[1])
+    parser.add_argument('--rounds', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shoe', choices=SHOE_TYPES, default='array')
+    parser.add_argument('--bet', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', default='.cache/sweep')
+    args = parser.parse_args()
+
+    cells = make_grid(args.decks, args.rules, args.penetration, args.policy, args.spread, args.players,
+                      args.rounds, args.seed, args.shoe, args.bet)
+    start = time.perf_counter()
+    results, computed = run_sweep(cells, ResultCache(args.cache), args.workers)
+    elapsed = time.perf_counter() - start
+    print(format_sweep(results))
+    print(f"{len(cells)} cells: {len(cells) - computed} from the cache, {computed} computed in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
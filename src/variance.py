@@ -0,0 +1,208 @@
+import argparse
+import math
+import random
+import statistics
+import time
+from array import array
+from CardClass import CARD_RANK_CLASS
+from rules import RuleSet, parse_rules
+from simulation import Simulator, POLICIES
+from stats import Z_95
+
+# Variance reduction for simulations played a shoe at a time. Each shoe is a card order
+# given to Shoe.load and played to its cut card, so the shoes can be chosen:
+#   common random numbers: two configurations play the very same shoes and their
+#     difference is taken shoe by shoe,
+#   antithetic: shoes come in pairs, the second shuffled from the complements (1 - u) of
+#     the uniforms behind the first,
+#   stratified: the number of tens and aces dealt before the cut card is stratified
+#     into equally likely bands, with the same number of shoes from each band.
+# EV per round is a ratio (chips over rounds, which vary by shoe), so variances are
+# worked out on the linearized per-shoe values net - EV * rounds.
+
+
+def _shuffled(uniforms: list[float], num_decks: int) -> array:
+    # Fisher-Yates driven by the given uniforms, one per swap
+    codes = array('b', range(52)) * num_decks
+    for i, u in zip(range(len(codes) - 1, 0, -1), uniforms):
+        j = min(int(u * (i + 1)), i)
+        codes[i], codes[j] = codes[j], codes[i]
+    return codes
+
+
+def random_shoe(rng: random.Random, num_decks: int) -> array:
+    return _shuffled([rng.random() for _ in range(52 * num_decks - 1)], num_decks)
+
+
+def antithetic_shoes(rng: random.Random, num_decks: int) -> tuple[array, array]:
+    uniforms = [rng.random() for _ in range(52 * num_decks - 1)]
+    return _shuffled(uniforms, num_decks), _shuffled([1 - u for u in uniforms], num_decks)
+
+
+def _high_cards_cdf(num_decks: int, dealt: int) -> list[float]:
+    # hypergeometric distribution of the tens and aces among the first dealt cards
+    size = 52 * num_decks
+    high = 20 * num_decks
+    total = math.comb(size, dealt)
+    cdf = []
+    running = 0
+    for count in range(min(high, dealt) + 1):
+        running += math.comb(high, count) * math.comb(size - high, dealt - count)
+        cdf.append(running / total)
+    return cdf
+
+
+def stratified_shoe(rng: random.Random, num_decks: int, dealt: int, cdf: list[float], stratum: int,
+                    strata: int) -> array:
+    # a shoe from one band of the high card count in the first dealt cards (cdf from
+    # _high_cards_cdf); u is uniform within the band, turned into a count by the inverse cdf
+    u = (stratum + rng.random()) / strata
+    count = next((i for i, p in enumerate(cdf) if p >= u), len(cdf) - 1)
+    high = [code for code in range(52) if CARD_RANK_CLASS[code] >= 8] * num_decks
+    low = [code for code in range(52) if CARD_RANK_CLASS[code] < 8] * num_decks
+    rng.shuffle(high)
+    rng.shuffle(low)
+    front = high[:count] + low[:dealt - count]
+    back = high[count:] + low[dealt - count:]
+    rng.shuffle(front)
+    rng.shuffle(back)
+    return array('b', front + back)
+
+
+def play_shoe(simulator: Simulator, codes: array) -> tuple[float, int]:
+    # play one shoe to its cut card: (net for all seats in bets, rounds played)
+    game = simulator.game
+    deck = game.deck
+    deck.load(codes)
+    net = sum(seat.net for seat in simulator.seats)
+    rounds = simulator.rounds
+    while True:
+        simulator.play_round()
+        if deck.needs_reshuffle() or len(deck) < (game.num_players + 1) * 5:
+            break
+    return (sum(seat.net for seat in simulator.seats) - net) / simulator.bet, simulator.rounds - rounds
+
+
+def _linearized(shoes: list[tuple[float, int]]) -> tuple[float, list[float], float]:
+    # EV per round, the per-shoe values whose mean has the same variance (to first order)
+    # once divided by the mean rounds squared, and that mean
+    net = sum(n for n, _ in shoes)
+    rounds = sum(r for _, r in shoes)
+    ev = net / rounds
+    return ev, [n - ev * r for n, r in shoes], rounds / len(shoes)
+
+
+def _stderr(variance_of_mean: float, mean_rounds: float) -> float:
+    return math.sqrt(variance_of_mean) / mean_rounds
+
+
+def _make_simulator(args, rules: RuleSet, policy: str, seed) -> Simulator:
+    return Simulator(num_players=args.players, num_decks=args.decks, bet=args.bet, policy=POLICIES[policy],
+                     rng=random.Random(seed), penetration=args.penetration, rules=rules)
+
+
+# each mode returns its report lines and how many shoes it played (per configuration for
+# compare): antithetic plays whole pairs and stratified whole strata, so not always --shoes
+
+def compare(args) -> tuple[list[str], int]:
+    # the same shoes for both configurations, against what independent shoes would have given
+    rng = random.Random(args.seed)
+    a = _make_simulator(args, args.rules_a, args.policy_a, args.seed)
+    b = _make_simulator(args, args.rules_b, args.policy_b, args.seed)
+    shoes_a, shoes_b = [], []
+    for _ in range(args.shoes):
+        codes = random_shoe(rng, args.decks)
+        shoes_a.append(play_shoe(a, codes))
+        shoes_b.append(play_shoe(b, codes))
+    ev_a, z_a, rounds_a = _linearized(shoes_a)
+    ev_b, z_b, rounds_b = _linearized(shoes_b)
+    # per-round differences need both sides on the same footing, so each is scaled by its own mean rounds
+    paired = statistics.variance([x / rounds_a - y / rounds_b for x, y in zip(z_a, z_b)]) / args.shoes
+    independent = (statistics.variance(z_a) / rounds_a ** 2 + statistics.variance(z_b) / rounds_b ** 2) / args.shoes
+    return [
+        f"A ({args.rules_a.describe()}, {args.policy_a}): EV {ev_a * 100:+.3f}% per round",
+        f"B ({args.rules_b.describe()}, {args.policy_b}): EV {ev_b * 100:+.3f}% per round",
+        f"A - B: {(ev_a - ev_b) * 100:+.3f}% +/- {Z_95 * math.sqrt(paired) * 100:.3f}% with common shoes, "
+        f"+/- {Z_95 * math.sqrt(independent) * 100:.3f}% with independent shoes",
+        # the same configuration twice matches on every shoe
+        f"variance reduction {independent / paired if paired else math.inf:.1f}x "
+        f"(independent runs need that many times the rounds)",
+    ], len(shoes_a)
+
+
+def antithetic(args) -> tuple[list[str], int]:
+    rng = random.Random(args.seed)
+    simulator = _make_simulator(args, args.rules_a, args.policy_a, args.seed)
+    shoes = []
+    for _ in range(args.shoes // 2):
+        first, second = antithetic_shoes(rng, args.decks)
+        shoes.append(play_shoe(simulator, first))
+        shoes.append(play_shoe(simulator, second))
+    ev, z, rounds = _linearized(shoes)
+    pairs = len(shoes) // 2
+    paired = statistics.variance([(z[2 * i] + z[2 * i + 1]) / 2 for i in range(pairs)]) / pairs
+    independent = statistics.variance(z) / len(shoes)
+    return [
+        f"EV {ev * 100:+.3f}% +/- {Z_95 * _stderr(paired, rounds) * 100:.3f}% per round with antithetic pairs, "
+        f"+/- {Z_95 * _stderr(independent, rounds) * 100:.3f}% for as many independent shoes",
+        f"variance reduction {independent / paired:.2f}x",
+    ], len(shoes)
+
+
+def stratified(args) -> tuple[list[str], int]:
+    rng = random.Random(args.seed)
+    simulator = _make_simulator(args, args.rules_a, args.policy_a, args.seed)
+    dealt = simulator.game.deck.cut_card
+    cdf = _high_cards_cdf(args.decks, dealt)
+    per_stratum = max(2, args.shoes // args.strata)
+    bands = [[play_shoe(simulator, stratified_shoe(rng, args.decks, dealt, cdf, stratum, args.strata))
+              for _ in range(per_stratum)] for stratum in range(args.strata)]
+    shoes = [shoe for band in bands for shoe in band]
+    ev, z, rounds = _linearized(shoes)
+    # equal weights and equal allocation, so the estimate is the plain mean
+    weight = 1 / args.strata
+    layered = sum(weight ** 2 * statistics.variance(z[i * per_stratum:(i + 1) * per_stratum]) / per_stratum
+                  for i in range(args.strata))
+    independent = statistics.variance(z) / len(shoes)
+    return [
+        f"EV {ev * 100:+.3f}% +/- {Z_95 * _stderr(layered, rounds) * 100:.3f}% per round over {args.strata} strata, "
+        f"+/- {Z_95 * _stderr(independent, rounds) * 100:.3f}% for as many independent shoes",
+        f"variance reduction {independent / layered:.2f}x",
+    ], len(shoes)
+
+
+MODES = {'compare': compare, 'antithetic': antithetic, 'stratified': stratified}
+# every variance needs two points: two shoes, two antithetic pairs (stratified always plays two per stratum)
+MIN_SHOES = {'compare': 2, 'antithetic': 4, 'stratified': 1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a shoe at a time with variance reduction")
+    parser.add_argument('mode', choices=sorted(MODES))
+    parser.add_argument('--shoes', type=int, default=2000)
+    parser.add_argument('--strata', type=int, default=10)
+    parser.add_argument('--players', type=int, default=1)
+    parser.add_argument('--decks', type=int, default=6)
+    parser.add_argument('--penetration', type=float, default=0.75)
+    parser.add_argument('--bet', type=int, default=10)
+    parser.add_argument('--rules-a', type=parse_rules, default=RuleSet())
+    parser.add_argument('--rules-b', type=parse_rules, default=RuleSet(), help="compare only")
+    parser.add_argument('--policy-a', choices=sorted(POLICIES), default='basic')
+    parser.add_argument('--policy-b', choices=sorted(POLICIES), default='basic', help="compare only")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.shoes < MIN_SHOES[args.mode]:
+        parser.error(f"{args.mode} needs --shoes of at least {MIN_SHOES[args.mode]}")
+    if args.strata < 1:
+        parser.error("--strata must be at least 1")
+
+    start = time.perf_counter()
+    lines, played = MODES[args.mode](args)
+    elapsed = time.perf_counter() - start
+    print("\n".join(lines))
+    each = " for each configuration" if args.mode == 'compare' else ""
+    print(f"{played} shoes{each} in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()